@@ -0,0 +1,189 @@
+"""Versioned JSON API.
+
+Every collection is streamed as a JSON array straight from a server-side
+cursor, so exporting hundreds of thousands of rows keeps memory flat and the
+first bytes go out as soon as the first batch is fetched.
+
+    GET /api/v1/shows?city=Austin&state=TX&genre=Jazz&from=2026-01-01&to=2026-01-31
+    GET /api/v1/venues?state=NY&fields=id,name,city
+    GET /api/v1/artists?genre=Folk
+    GET /api/v1/artists?state=NY&seeking_venue=true&available_on=2026-11-20
+
+``fields`` picks the attributes returned (default: all of them). Only the
+selected columns are queried.
+"""
+import json
+from datetime import date, datetime, time, timedelta
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+import pooling
+from enums import TRUE_VALUES
+from models import db, Venue, Artist, Show
+from queries import available_artist_ids, genre_filter, until
+from versions import conditional
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Rows fetched from the cursor (and written out) at a time.
+BATCH_SIZE = 1000
+
+VENUE_FIELDS = {
+    'id': Venue.id,
+    'name': Venue.name,
+    'city': Venue.city,
+    'state': Venue.state,
+    'address': Venue.address,
+    'phone': Venue.phone,
+    'genres': Venue.genres,
+    'image_link': Venue.image_link,
+    'facebook_link': Venue.facebook_link,
+    'website': Venue.website,
+    'seeking_talent': Venue.seeking_talent,
+    'seeking_description': Venue.seeking_description,
+}
+
+ARTIST_FIELDS = {
+    'id': Artist.id,
+    'name': Artist.name,
+    'city': Artist.city,
+    'state': Artist.state,
+    'phone': Artist.phone,
+    'genres': Artist.genres,
+    'image_link': Artist.image_link,
+    'website_link': Artist.website_link,
+    'facebook_link': Artist.facebook_link,
+    'seeking_venue': Artist.seeking_venue,
+    'seeking_description': Artist.seeking_description,
+}
+
+SHOW_FIELDS = {
+    'id': Show.id,
+    'start_time': Show.start_time,
+    'end_time': Show.end_time,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'venue_city': Venue.city,
+    'venue_state': Venue.state,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link,
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+@api.errorhandler(BadRequest)
+def bad_request(error):
+    return jsonify(error=str(error)), 400
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def _fields(available):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(available)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise BadRequest('Unknown fields: {}. Available: {}'.format(
+            ', '.join(unknown), ', '.join(available)))
+    return fields
+
+
+def _date(name, parse=datetime.fromisoformat):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return parse(value)
+    except ValueError:
+        raise BadRequest('{} must be an ISO 8601 date or datetime'.format(name))
+
+
+def _stream(query, fields):
+    def generate():
+        yield '['
+        separator = ''
+        chunk = []
+        rows = query \
+            .execution_options(stream_results=True) \
+            .yield_per(BATCH_SIZE)
+        for row in rows:
+            chunk.append(separator + json.dumps(dict(zip(fields, row)), default=_default))
+            separator = ','
+            if len(chunk) == BATCH_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+                # The time the client took to read the chunk is not the
+                # query's (see pooling.py).
+                pooling.restart_timeouts()
+        yield ''.join(chunk) + ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def _filter_place(query, model):
+    if request.args.get('city'):
+        query = query.filter(model.city == request.args['city'])
+    if request.args.get('state'):
+        query = query.filter(model.state == request.args['state'])
+    return query
+
+
+@api.route('/venues')
+@conditional('venues')
+def venues():
+    fields = _fields(VENUE_FIELDS)
+    query = db.session.query(*[VENUE_FIELDS[field] for field in fields])
+    query = _filter_place(query, Venue)
+    if request.args.get('genre'):
+        query = query.filter(genre_filter(Venue.genres, request.args['genre']))
+    return _stream(query.order_by(Venue.id), fields)
+
+
+@api.route('/artists')
+@conditional('artists', 'availabilities')
+def artists():
+    """Artists filtered by city/state, genre, ``seeking_venue`` and
+    ``available_on``: having an availability window on that day."""
+    fields = _fields(ARTIST_FIELDS)
+    query = db.session.query(*[ARTIST_FIELDS[field] for field in fields])
+    query = _filter_place(query, Artist)
+    if request.args.get('genre'):
+        query = query.filter(genre_filter(Artist.genres, request.args['genre']))
+    if request.args.get('seeking_venue'):
+        query = query.filter(Artist.seeking_venue == (request.args['seeking_venue'].lower() in TRUE_VALUES))
+    day = _date('available_on')
+    if day:
+        start = datetime.combine(day.date(), time())
+        query = query.filter(Artist.id.in_(available_artist_ids(start, start + timedelta(days=1))))
+    return _stream(query.order_by(Artist.id), fields)
+
+
+@api.route('/shows')
+@conditional('shows', 'venues', 'artists')
+def shows():
+    """Shows filtered by their venue's city/state, their artist's genre and
+    a ``from``/``to`` start time range. Both bounds are inclusive, as on
+    /shows: ``to=2026-02-01`` includes the shows of February 1st."""
+    fields = _fields(SHOW_FIELDS)
+    query = db.session \
+        .query(*[SHOW_FIELDS[field] for field in fields]) \
+        .select_from(Show) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id)
+    query = _filter_place(query, Venue)
+    if request.args.get('genre'):
+        query = query.filter(genre_filter(Artist.genres, request.args['genre']))
+    start, end = _date('from'), _date('to', until)
+    if start:
+        query = query.filter(Show.start_time >= start)
+    if end:
+        query = query.filter(Show.start_time < end)
+    return _stream(query.order_by(Show.start_time, Show.id), fields)
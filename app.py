@@ -2,161 +2,227 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import sys
-import dateutil.parser
-import babel
+from functools import lru_cache
 from flask import (
     Flask, 
+    current_app,
     render_template, 
     request, 
     flash, 
     redirect, 
-    url_for
+    url_for,
+    jsonify
 )
 from flask_migrate import Migrate
 from flask_moment import Moment
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 import logging
 from logging import Formatter, FileHandler
-from forms import *
-from models import db, Venue, Artist, Show
+from api import api
+import assets
+import bookings
+import cache
+import compression
+import exporter
+import fragments
+import importer
+import instrumentation
+import pooling
+import replicas
+import templating
+import versions
+from cache import detail_cache
+from enums import STATES
+from fragments import fragment_cache
+from models import db, Venue, Artist, Show, Availability, DEFAULT_SHOW_DURATION
+from pagination import keyset_paginate, page_url
+from profiles import load_profile
+from queries import (
+    venue_areas,
+    upcoming_show_counts,
+    show_counts,
+    upcoming_shows,
+    past_shows,
+    periods,
+    until,
+    within_availability
+)
+from search import search
+from versions import conditional, Entity, Started, Today
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
-migrate = Migrate(app, db)
+moment = Moment()
+migrate = Migrate()
+
+# Views are collected here and added to every app create_app() builds.
+# Unlike a blueprint's, their endpoints keep their plain names ('venues',
+# 'show_venue'), which the templates and per-endpoint settings use.
+views = []
+
+def route(rule, **options):
+    def decorator(view):
+        views.append((rule, view, options))
+        return view
+    return decorator
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+    'time': "h:mma",
+}
+
+# Babel and dateutil are imported on first use (see preload()).
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+    import babel.dates
+    return babel.dates.parse_pattern(format), babel.Locale.parse(locale)
+
+# Listings repeat the same start times over and over (and every page render
+# formats them again), so formatted values are memoized too.
+@lru_cache(maxsize=32768)
+def _format_datetime(value, format, locale):
+    format = DATETIME_FORMATS.get(format, format)
+    if format in ('full', 'long', 'medium', 'short'):
+        # Babel's own named formats.
+        import babel.dates
+        return babel.dates.format_datetime(value, format, locale=locale)
+    pattern, locale = datetime_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+def format_datetime(value, format='medium', locale='en'):
+    if isinstance(value, str):
+        import dateutil.parser
+        value = dateutil.parser.parse(value)
+    return _format_datetime(value, format, locale)
 
 
-app.jinja_env.filters['datetime'] = format_datetime
-
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@route('/')
+@conditional()
 def index():
     return render_template('pages/home.html')
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@route('/venues')
+@conditional('venues', 'shows', Started())
 def venues():
-    data_areas = []
-
-    areas = Venue.query \
-        .with_entities(Venue.city, Venue.state) \
-        .group_by(Venue.city, Venue.state) \
-        .all()
-    
-    for area in areas:
-        data_venues = []
+    page = venue_areas(
+        current_app.config['ITEMS_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before'))
 
-        venues = Venue.query \
-            .filter_by(state=area.state) \
-            .filter_by(city=area.city) \
-            .all()
-    
-        for venue in venues:
-            upcoming_shows = db.session \
-                .query(Show) \
-                .filter(Show.venue_id ==venue.id) \
-                .filter(Show.start_time > datetime.now()) \
-                .all()
-
-            data_venues.append({
-                'id': venue.id,
-                'name': venue.name,
-                'num_upcoming_shows': len(upcoming_shows)
-            })
-
-        data_areas.append({
-            'city': area.city,
-            'state': area.state,
-            'venues': data_venues
-        })
+    stamps = versions.stamps(('venues', venue['id']) for area in page.items for venue in area['venues'])
+    for area in page.items:
+        # Areas split across pages differ in their venues, not only stamps.
+        area['stamp'] = tuple((venue['id'], stamps[('venues', venue['id'])]) for venue in area['venues'])
 
-    return render_template('pages/venues.html', areas=data_areas)
+    return render_template('pages/venues.html', areas=page.items, page=page)
 
-@app.route('/venues/search', methods=['POST'])
+@route('/venues/search', methods=['POST'])
 def search_venues():
     search_term = request.form.get('search_term')
-    venues = Venue.query.filter(
-        Venue.name.ilike('%{}%'.format(search_term))).all()
+    venues = search(Venue, search_term, current_app.config['SEARCH_RESULT_LIMIT'])
+    counts = upcoming_show_counts(Show.venue_id, [venue.id for venue in venues])
 
     data = []
     for venue in venues:
         tmp = {}
         tmp['id'] = venue.id
         tmp['name'] = venue.name
-        tmp['num_upcoming_shows'] = len(venue.shows)
+        tmp['num_upcoming_shows'] = counts[venue.id]
         data.append(tmp)
 
     response = {}
     response['count'] = len(data)
     response['data'] = data
-    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
+    return render_template('pages/search_venues.html', results=response,
+                           search_term=request.form.get('search_term', ''))
+
+def venue_show(show):
+    return {
+        'artist_id': show.artist_id,
+        'artist_name': show.artist_name,
+        'artist_image_link': show.artist_image_link,
+        'start_time': show.start_time
+    }
 
-    venue = Venue.query.get_or_404(venue_id)
+def venue_view(venue_id):
 
-    past_shows = []
-    upcoming_shows = []
+    venue = load_profile(Venue, 'detail').get_or_404(venue_id)
 
-    for show in venue.shows:
-        temp_show = {
-            'artist_id': show.artist_id,
-            'artist_name': show.artist.name,
-            'artist_image_link': show.artist.image_link,
-            'start_time': show.start_time.strftime('%m/%d/%Y, %H:%M')
-        }
-        if show.start_time <= datetime.now():
-            past_shows.append(temp_show)
-        else:
-            upcoming_shows.append(temp_show)
+    now = datetime.now()
+    upcoming = upcoming_shows(Show.venue_id, venue_id, Artist, current_app.config['UPCOMING_SHOWS_LIMIT'], now)
+    past = past_shows(Show.venue_id, venue_id, Artist, current_app.config['PAST_SHOWS_PER_PAGE'], now=now)
+    upcoming_count, past_count = show_counts(Show.venue_id, venue_id, now)
 
     data = venue.to_dict()
 
-    data['past_shows'] = past_shows
-    data['upcoming_shows'] = upcoming_shows
-    data['past_shows_count'] = len(past_shows)
-    data['upcoming_shows_count'] = len(upcoming_shows)
+    data['past_shows'] = [venue_show(show) for show in past.items]
+    data['past_shows_next'] = past.next_cursor
+    data['upcoming_shows'] = [venue_show(show) for show in upcoming]
+    data['past_shows_count'] = past_count
+    data['upcoming_shows_count'] = upcoming_count
+
+    tags = {('venues', venue_id)}
+    tags.update(('artists', show['artist_id']) for show in data['past_shows'] + data['upcoming_shows'])
+
+    return data, tags
 
+@route('/venues/<int:venue_id>')
+@conditional(Entity('venues', 'venue_id'), 'artists', Started(Show.venue_id, 'venue_id'))
+def show_venue(venue_id):
+    data = detail_cache.get(('venue', venue_id), lambda: venue_view(venue_id), versions.current())
     return render_template('pages/show_venue.html', venue=data)
 
+@route('/venues/<int:venue_id>/past_shows')
+@conditional(Entity('venues', 'venue_id'), 'artists', Started(Show.venue_id, 'venue_id'))
+def venue_past_shows(venue_id):
+    page = past_shows(Show.venue_id, venue_id, Artist, current_app.config['PAST_SHOWS_PER_PAGE'],
+                      after=request.args.get('after'))
+    if not page.items:
+        # No (more) past shows, or no such venue at all.
+        Venue.query.with_entities(Venue.id).filter_by(id=venue_id).first_or_404()
+
+    data = []
+    for show in page.items:
+        tmp = venue_show(show)
+        tmp['start_time_label'] = format_datetime(tmp['start_time'], 'full')
+        tmp['start_time'] = tmp['start_time'].isoformat()
+        data.append(tmp)
+
+    return jsonify(data=data, next=page.next_cursor)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@route('/venues/create', methods=['GET'])
 def create_venue_form():
+    from forms import VenueForm
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@route('/venues/create', methods=['POST'])
 def create_venue_submission():
+    from forms import VenueForm
 
     error = False
     form = VenueForm(request.form)
@@ -178,11 +244,14 @@ def create_venue_submission():
             flash('Venue ' + request.form['name'] + ' was successfully listed!')
         return render_template('pages/home.html')
 
-@app.route('/venues/<int:venue_id>/delete', methods=['POST'])
+@route('/venues/<int:venue_id>/delete', methods=['POST'])
 def delete_venue(venue_id):
     error = False
+    # Deleted through the session (not a bulk delete) so the venue's shows
+    # cascade and the change is published to changes.py.
+    venue = load_profile(Venue, 'delete').get_or_404(venue_id)
     try:
-        Venue.query.filter_by(id=venue_id).delete()
+        db.session.delete(venue)
         db.session.commit()
     except:
         error = True
@@ -200,48 +269,43 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists')
+@route('/artists')
+@conditional('artists', 'shows', Started())
 def artists():
 
     data_artists = []
 
-    artists = Artist.query.with_entities(Artist.id, Artist.name) \
-        .order_by('id').all()
+    page = keyset_paginate(
+        Artist.query.with_entities(Artist.id, Artist.name),
+        keys=[Artist.name, Artist.id],
+        key_of=lambda artist: (artist.name, artist.id),
+        per_page=current_app.config['ITEMS_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before'))
+    counts = upcoming_show_counts(Show.artist_id, [artist.id for artist in page.items])
 
-    for artist in artists:
-        upcoming_shows = db.session \
-            .query(Show) \
-            .filter(Show.artist_id == artist.id) \
-            .filter(Show.start_time > datetime.now()) \
-            .all()
-        
+    for artist in page.items:
         data_artists.append({
             'id': artist.id,
             'name': artist.name,
-            'num_upcoming_shows': len(upcoming_shows)
+            'num_upcoming_shows': counts[artist.id]
         })
 
-    return render_template('pages/artists.html', artists=data_artists)
+    return render_template('pages/artists.html', artists=data_artists, page=page)
 
-@app.route('/artists/search', methods=['POST'])
+@route('/artists/search', methods=['POST'])
 def search_artists():
 
     search_term = request.form.get('search_term')
-    artists = Artist.query.filter(
-        Artist.name.ilike('%{}%'.format(search_term))).all()
+    artists = search(Artist, search_term, current_app.config['SEARCH_RESULT_LIMIT'])
+    counts = upcoming_show_counts(Show.artist_id, [artist.id for artist in artists])
 
     data_artists = []
     for artist in artists:
-        upcoming_shows = db.session \
-                .query(Show) \
-                .filter(Show.artist_id == artist.id) \
-                .filter(Show.start_time > datetime.now()) \
-                .all()
-
         data_artists.append({
             'id': artist.id,
             'name': artist.name,
-            'num_upcoming_shows': len(upcoming_shows)
+            'num_upcoming_shows': counts[artist.id]
         })
 
     response = {
@@ -251,53 +315,80 @@ def search_artists():
 
     return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
+def artist_show(show):
+    return {
+        'venue_id': show.venue_id,
+        'venue_name': show.venue_name,
+        'venue_image_link': show.venue_image_link,
+        'start_time': show.start_time
+    }
 
-    artist = Artist.query.get_or_404(artist_id)
+def artist_view(artist_id):
 
-    past_shows = []
-    upcoming_shows = []
+    artist = load_profile(Artist, 'detail').get_or_404(artist_id)
 
-    for show in artist.shows:
-        temp_show = {
-            'venue_id': show.venue_id,
-            'venue_name': show.venue.name,
-            'venue_image_link': show.venue.image_link,
-            'start_time': show.start_time.strftime('%m %d %Y, %H:%M')
-        }
-        if show.start_time <= datetime.now():
-            past_shows.append(temp_show)
-        else:
-            upcoming_shows.append(temp_show)
+    now = datetime.now()
+    upcoming = upcoming_shows(Show.artist_id, artist_id, Venue, current_app.config['UPCOMING_SHOWS_LIMIT'], now)
+    past = past_shows(Show.artist_id, artist_id, Venue, current_app.config['PAST_SHOWS_PER_PAGE'], now=now)
+    upcoming_count, past_count = show_counts(Show.artist_id, artist_id, now)
 
     data = artist.to_dict()
 
-    data['past_shows'] = past_shows
-    data['upcoming_shows'] = upcoming_shows
-    data['past_shows_count'] = len(past_shows)
-    data['upcoming_shows_count'] = len(upcoming_shows)
+    data['past_shows'] = [artist_show(show) for show in past.items]
+    data['past_shows_next'] = past.next_cursor
+    data['upcoming_shows'] = [artist_show(show) for show in upcoming]
+    data['past_shows_count'] = past_count
+    data['upcoming_shows_count'] = upcoming_count
+
+    tags = {('artists', artist_id)}
+    tags.update(('venues', show['venue_id']) for show in data['past_shows'] + data['upcoming_shows'])
 
+    return data, tags
+
+@route('/artists/<int:artist_id>')
+@conditional(Entity('artists', 'artist_id'), 'venues', Started(Show.artist_id, 'artist_id'))
+def show_artist(artist_id):
+    data = detail_cache.get(('artist', artist_id), lambda: artist_view(artist_id), versions.current())
     return render_template('pages/show_artist.html', artist=data)
 
+@route('/artists/<int:artist_id>/past_shows')
+@conditional(Entity('artists', 'artist_id'), 'venues', Started(Show.artist_id, 'artist_id'))
+def artist_past_shows(artist_id):
+    page = past_shows(Show.artist_id, artist_id, Venue, current_app.config['PAST_SHOWS_PER_PAGE'],
+                      after=request.args.get('after'))
+    if not page.items:
+        # No (more) past shows, or no such artist at all.
+        Artist.query.with_entities(Artist.id).filter_by(id=artist_id).first_or_404()
+
+    data = []
+    for show in page.items:
+        tmp = artist_show(show)
+        tmp['start_time_label'] = format_datetime(tmp['start_time'], 'full')
+        tmp['start_time'] = tmp['start_time'].isoformat()
+        data.append(tmp)
+
+    return jsonify(data=data, next=page.next_cursor)
+
 #  Update
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+    from forms import ArtistForm
     form = ArtistForm()
 
-    artist = Artist.query.get(artist_id)
+    artist = load_profile(Artist, 'edit').get(artist_id)
     form=ArtistForm(obj=artist)
     
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
+    from forms import ArtistForm
     try:
         error = False
-        artist = Artist.query.get(artist_id)
+        artist = load_profile(Artist, 'edit').get(artist_id)
         form = ArtistForm(request.form, meta={'csrf': False})
 
         if form.validate():
@@ -325,19 +416,21 @@ def edit_artist_submission(artist_id):
         else:
             return redirect(url_for('show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+    from forms import VenueForm
 
-    venue = Venue.query.get(venue_id)
+    venue = load_profile(Venue, 'edit').get(venue_id)
     form = VenueForm(obj=venue)
 
     return render_template('forms/edit_venue.html', form=form, venue=venue.to_dict())
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
+    from forms import VenueForm
     try:
         error = False
-        venue = Venue.query.get(venue_id)
+        venue = load_profile(Venue, 'edit').get(venue_id)
         form = VenueForm(request.form, meta={'csrf': False})
         if form.validate():
             venue.name = request.form['name']
@@ -370,14 +463,16 @@ def edit_venue_submission(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET'])
+@route('/artists/create', methods=['GET'])
 def create_artist_form():
+    from forms import ArtistForm
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@route('/artists/create', methods=['POST'])
 def create_artist_submission():
+    from forms import ArtistForm
 
     error = False
     form = ArtistForm(request.form)
@@ -399,50 +494,212 @@ def create_artist_submission():
             flash('Artist ' + request.form['name'] + ' was successfully listed!')
         return render_template('pages/home.html')
 
+#  Availability
+#  ----------------------------------------------------------------
+
+def render_availability(artist, form):
+    # The artist's current and future windows, soonest first.
+    query = Availability.query \
+        .filter(Availability.artist_id == artist.id) \
+        .filter(Availability.end_time > datetime.now())
+    page = keyset_paginate(
+        query,
+        keys=[Availability.start_time, Availability.id],
+        key_of=lambda window: (window.start_time, window.id),
+        per_page=current_app.config['ITEMS_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before'))
+    return render_template('pages/artist_availability.html', artist=artist, windows=page.items,
+                           page=page, form=form)
+
+@route('/artists/<int:artist_id>/availability')
+def artist_availability(artist_id):
+    from forms import AvailabilityForm
+    artist = load_profile(Artist, 'edit').get_or_404(artist_id)
+    return render_availability(artist, AvailabilityForm(meta={'csrf': False}))
+
+@route('/artists/<int:artist_id>/availability', methods=['POST'])
+def create_availability(artist_id):
+    from forms import AvailabilityForm
+    artist = load_profile(Artist, 'edit').get_or_404(artist_id)
+    form = AvailabilityForm(request.form, meta={'csrf': False})
+
+    if not form.validate():
+        for field, messages in form.errors.items():
+            flash('{}: {}'.format(field, ' '.join(messages)))
+        return render_availability(artist, form)
+
+    error = False
+    try:
+        window = Availability(artist_id=artist_id)
+        form.populate_obj(window)
+        db.session.add(window)
+        db.session.commit()
+    except:
+        error = True
+        db.session.rollback()
+        print(sys.exc_info())
+    finally:
+        db.session.close()
+        if error:
+            flash('The window could not be added. Please try again.')
+        else:
+            flash('Availability was successfully added!')
+    return redirect(url_for('artist_availability', artist_id=artist_id))
+
+@route('/artists/<int:artist_id>/availability/<int:availability_id>/delete', methods=['POST'])
+def delete_availability(artist_id, availability_id):
+    error = False
+    window = Availability.query \
+        .filter_by(id=availability_id, artist_id=artist_id) \
+        .first_or_404()
+    try:
+        db.session.delete(window)
+        db.session.commit()
+    except:
+        error = True
+        db.session.rollback()
+        print(sys.exc_info())
+    finally:
+        db.session.close()
+        if error:
+            flash('Delete action could not be completed. Try again')
+        else:
+            flash('Availability sucessfully removed')
+    return redirect(url_for('artist_availability', artist_id=artist_id))
+
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+def show_range(args, now):
+    """The ``(start, end)`` of the shows asked for: a named period (``when``),
+    or dates ``from`` and ``to``, both inclusive as in /api/v1/shows (see
+    queries.until()). Either end may be None; ``end`` is exclusive."""
+    if args.get('when'):
+        return periods(now).get(args['when'], (None, None))
+    start = end = None
+    if args.get('from'):
+        start = datetime.fromisoformat(args['from'])
+    if args.get('to'):
+        end = until(args['to'])
+    return start, end
+
+@route('/shows')
+@conditional('shows', 'venues', 'artists', Today())
 def shows():
-    shows = Show.query.all()
-
     data = []
 
-    results = db.session.query(Show, Venue, Artist) \
+    query = db.session \
+        .query(
+            Show.id,
+            Show.start_time,
+            Show.end_time,
+            Venue.id.label('venue_id'),
+            Venue.name.label('venue_name'),
+            Artist.id.label('artist_id'),
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link')) \
         .join(Venue, Show.venue_id == Venue.id) \
-        .join(Artist, Show.artist_id == Artist.id) \
-        .order_by(Show.start_time.desc()) \
-        .all()
+        .join(Artist, Show.artist_id == Artist.id)
 
-    for show, venue, artist in results:
+    try:
+        start, end = show_range(request.args, datetime.now())
+    except ValueError:
+        flash('Dates must be given as YYYY-MM-DD.')
+        start = end = None
+    # A range is read from the start_time index (BRIN on Postgres) and
+    # listed soonest first; without one, the latest shows come first.
+    if start:
+        query = query.filter(Show.start_time >= start)
+    if end:
+        query = query.filter(Show.start_time < end)
+    if request.args.get('city'):
+        query = query.filter(Venue.city == request.args['city'])
+    if request.args.get('state'):
+        query = query.filter(Venue.state == request.args['state'])
+
+    page = keyset_paginate(
+        query,
+        keys=[Show.start_time, Show.id],
+        key_of=lambda show: (show.start_time, show.id),
+        per_page=current_app.config['ITEMS_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=not (start or end))
+
+    stamps = versions.stamps(
+        key for show in page.items
+        for key in (('shows', show.id), ('venues', show.venue_id), ('artists', show.artist_id)))
+
+    for show in page.items:
         data.append({
-            'venue_id': venue.id,
-            'venue_name': venue.name,
-            'artist_id': artist.id,
-            'artist_name': artist.name,
-            'artist_image_link': artist.image_link,
-            'start_time': show.start_time.strftime('%m %d %Y, %H:%M')
+            'id': show.id,
+            'stamp': (
+                stamps[('shows', show.id)],
+                stamps[('venues', show.venue_id)],
+                stamps[('artists', show.artist_id)]),
+            'venue_id': show.venue_id,
+            'venue_name': show.venue_name,
+            'artist_id': show.artist_id,
+            'artist_name': show.artist_name,
+            'artist_image_link': show.artist_image_link,
+            'start_time': show.start_time,
+            'end_time': show.end_time
         })
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=data, page=page, states=STATES)
 
 
-@app.route('/shows/create')
+@route('/shows/create')
 def create_shows():
+    from forms import ShowForm
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@route('/shows/create', methods=['POST'])
 def create_show_submission():
+    from forms import ShowForm
     error = False
-    form = ShowForm(request.form)
+    unavailable = False
+    conflict = None
+    form = ShowForm(request.form, meta={'csrf': False})
+
+    if not form.validate():
+        for field, messages in form.errors.items():
+            flash('{}: {}'.format(field, ' '.join(messages)))
+        return render_template('forms/new_show.html', form=form)
 
     try:
         show = Show()
         form.populate_obj(show)
-        db.session.add(show)
-        db.session.commit()  
+        if show.end_time is None:
+            show.end_time = show.start_time + DEFAULT_SHOW_DURATION
+        booking = {
+            'venue_id': int(show.venue_id),
+            'artist_id': int(show.artist_id),
+            'start_time': show.start_time,
+            'end_time': show.end_time}
+        # Checked and written under the lock, so no other booking lands between.
+        bookings.lock(booking)
+        # Artists who published availability can only be booked inside it.
+        unavailable = not within_availability(booking['artist_id'], show.start_time, show.end_time)
+        if not unavailable:
+            conflict = bookings.calendar.conflict(booking)
+        if not unavailable and conflict is None:
+            db.session.add(show)
+            db.session.flush()
+            booking['id'] = show.id
+            db.session.commit()
+            bookings.calendar.add(booking)
+    except IntegrityError as e:
+        db.session.rollback()
+        # Lost a race to another booking; Postgres' exclusion constraint caught it.
+        if bookings.overlapping(e):
+            conflict = None, None, None
+        else:
+            error = True
+            print(sys.exc_info())
     except:
         error = True
         db.session.rollback()
@@ -451,32 +708,107 @@ def create_show_submission():
         db.session.close()
         if error:
             flash ('Your show submission failed. Please try again.')
+        elif unavailable:
+            flash('The artist is not available at that time.')
+        elif conflict:
+            table, id, show_id = conflict
+            flash('The {} is already booked for a show at that time{}.'.format(
+                {'venues': 'venue', 'artists': 'artist'}.get(table, 'venue or artist'),
+                ' (show {})'.format(show_id) if show_id else ''))
         else:
             flash('Show was successfully listed!')
 
     return render_template('pages/home.html')
 
 
-@app.errorhandler(404)
+#  Metrics
+#  ----------------------------------------------------------------
+
+@route('/metrics/cache')
+def cache_metrics():
+    return jsonify(detail_cache=detail_cache.stats(), fragment_cache=fragment_cache.stats())
+
+
+@route('/metrics/pool')
+def pool_metrics():
+    engines = {bind: db.get_engine(bind=bind) for bind in current_app.config['REPLICA_BINDS']}
+    engines['primary'] = db.engine
+    return jsonify(pool=pooling.stats(engines))
+
+
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
+#----------------------------------------------------------------------------#
+# App Factory.
+#----------------------------------------------------------------------------#
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+def create_app(config='config'):
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    # Sessions and flashed messages are signed with SECRET_KEY, so every
+    # worker (and every restart) must use the same one. DEBUG is on in
+    # config.py, so only FLASK_ENV=development says this is a local run.
+    if not app.config['SECRET_KEY']:
+        if app.config['ENV'] != 'development':
+            raise RuntimeError('Set the SECRET_KEY environment variable.')
+        app.logger.warning('SECRET_KEY is not set; using a random key for this process.')
+        app.config['SECRET_KEY'] = os.urandom(32)
+
+    moment.init_app(app)
+    db.init_app(app)
+    migrate.init_app(app, db)
+    # First, so it runs after every other after_request hook.
+    compression.init_app(app)
+    cache.init_app(app)
+    fragments.init_app(app)
+    importer.init_app(app)
+    exporter.init_app(app)
+    versions.init_app(app)
+    assets.init_app(app)
+    instrumentation.init_app(app)
+    replicas.init_app(app)
+    templating.init_app(app)
+    app.register_blueprint(api)
+
+    for rule, view, options in views:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.register_error_handler(404, not_found_error)
+    app.register_error_handler(500, server_error)
+
+    app.jinja_env.filters['datetime'] = format_datetime
+    app.jinja_env.globals['page_url'] = page_url
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    return app
+
+
+def preload():
+    """Import the modules views load on first use.
+
+    create_app() leaves them out so commands and single requests start
+    quickly. A server that forks its workers from a preloaded app (see
+    wsgi.py) calls this first, so the workers share them instead of each
+    importing its own copy.
+    """
+    import babel.dates
+    import dateutil.parser
+    import forms
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -484,11 +816,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
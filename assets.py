@@ -0,0 +1,201 @@
+"""Fingerprinted, precompressed static files.
+
+    flask build-assets
+
+copies every file under static/ into ``ASSETS_DIR`` with a hash of its
+content in the name (css/main.css becomes css/main.1a2b3c4d5e6f.css), next
+to gzip and, when the brotli package is installed, brotli variants of the
+files that compress, and writes a manifest of them. References between the
+files (``url()`` in stylesheets, source maps) are rewritten to the new
+names. Files from earlier builds are kept, so pages rendered before a
+deploy still find theirs.
+
+Templates link to files with ``static_url('css/main.css')``. Files in the
+manifest are served from ``ASSETS_URL_PATH``, in the smallest variant the
+client accepts, and cached for a year as immutable: a changed file gets a
+new name. Without a manifest (no build yet) it falls back to /static.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import click
+from flask import abort, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST = 'manifest.json'
+
+# Already compressed; not worth another pass.
+COMPRESSED = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.ico', '.woff', '.woff2', '.gz', '.br', '.zip'}
+
+# Variants in order of preference, with their file suffixes.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Variants saving less than this fraction are not kept.
+MIN_SAVING = 0.1
+
+MAX_AGE = 365 * 24 * 60 * 60
+
+_css_url = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+_source_map = re.compile(r'(sourceMappingURL=)(\S+)')
+
+# Original path -> {'path': fingerprinted path, 'encodings': [...]}.
+manifest = {}
+# Fingerprinted path -> the same entry.
+_served = {}
+
+
+def fingerprinted(path, content):
+    root, ext = posixpath.splitext(path)
+    return '{}.{}{}'.format(root, hashlib.md5(content).hexdigest()[:12], ext)
+
+
+def _rewrite(path, content, entries):
+    """Point references to other built files at their fingerprinted names."""
+    directory = posixpath.dirname(path)
+
+    def replace(url):
+        target, sep, suffix = re.match(r'([^?#]*)([?#]?)(.*)', url).groups()
+        if not target or '://' in target or target.startswith(('/', 'data:')):
+            return url
+        entry = entries.get(posixpath.normpath(posixpath.join(directory, target)))
+        if entry is None:
+            return url
+        return posixpath.relpath(entry['path'], directory or '.') + sep + suffix
+
+    text = content.decode('utf-8', 'surrogateescape')
+    if path.endswith('.css'):
+        text = _css_url.sub(lambda m: 'url({0}{1}{0})'.format(m.group(1), replace(m.group(2))), text)
+    elif path.endswith('.js'):
+        text = _source_map.sub(lambda m: m.group(1) + replace(m.group(2)), text)
+    return text.encode('utf-8', 'surrogateescape')
+
+
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data, 9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def build(source, target):
+    """Build every file under ``source`` into ``target``; returns the manifest."""
+    paths = sorted(
+        os.path.relpath(os.path.join(root, name), source).replace(os.sep, '/')
+        for root, dirs, files in os.walk(source)
+        for name in files)
+    # Referenced files first, so stylesheets and scripts can point at them.
+    paths.sort(key=lambda path: path.endswith(('.css', '.js')))
+
+    entries = {}
+    for path in paths:
+        with open(os.path.join(source, path), 'rb') as f:
+            content = f.read()
+        if path.endswith(('.css', '.js')):
+            content = _rewrite(path, content, entries)
+        entry = entries[path] = {'path': fingerprinted(path, content), 'encodings': []}
+
+        output = os.path.join(target, entry['path'])
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'wb') as f:
+            f.write(content)
+        if posixpath.splitext(path)[1].lower() in COMPRESSED:
+            continue
+        for encoding, suffix in ENCODINGS:
+            if encoding == 'br' and brotli is None:
+                continue
+            compressed = _compress(content, encoding)
+            if len(compressed) <= len(content) * (1 - MIN_SAVING):
+                with open(output + suffix, 'wb') as f:
+                    f.write(compressed)
+                entry['encodings'].append(encoding)
+
+    with open(os.path.join(target, MANIFEST), 'w') as f:
+        json.dump(entries, f, indent=2, sort_keys=True)
+    return entries
+
+
+def static_url(filename):
+    entry = manifest.get(filename)
+    if entry is None:
+        return url_for('static', filename=filename)
+    return url_for('assets', filename=entry['path'])
+
+
+def _earlier_build(directory, filename):
+    # Still linked from pages rendered (or cached) before the last build.
+    path = safe_join(directory, filename)
+    if filename == MANIFEST or path is None or not os.path.isfile(path):
+        return None
+    return {'path': filename,
+            'encodings': [encoding for encoding, suffix in ENCODINGS if os.path.isfile(path + suffix)]}
+
+
+def serve(filename):
+    directory = current_app.config['ASSETS_DIR']
+    entry = _served.get(filename) or _earlier_build(directory, filename)
+    if entry is None:
+        abort(404)
+    accepted = request.accept_encodings
+    encoding = accepted.best_match(entry['encodings']) if entry['encodings'] else None
+    suffix = dict(ENCODINGS).get(encoding, '')
+
+    response = send_from_directory(
+        directory, filename + suffix,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        max_age=MAX_AGE, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if entry['encodings']:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@click.command('build-assets')
+@click.option('--clean', is_flag=True, help='Remove the files of earlier builds first.')
+@with_appcontext
+def build_assets_command(clean):
+    """Fingerprint and precompress the files under static/."""
+    target = current_app.config['ASSETS_DIR']
+    if clean:
+        shutil.rmtree(target, ignore_errors=True)
+    entries = build(current_app.static_folder, target)
+    compressed = sum(1 for entry in entries.values() if entry['encodings'])
+    click.echo('built {} files ({} precompressed) into {}'.format(len(entries), compressed, target))
+    if brotli is None:
+        click.echo('brotli is not installed: wrote gzip variants only', err=True)
+
+
+def load(directory):
+    """Read the manifest built into ``directory``; returns its digest."""
+    manifest.clear()
+    _served.clear()
+    try:
+        with open(os.path.join(directory, MANIFEST), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    manifest.update(json.loads(data))
+    _served.update((entry['path'], entry) for entry in manifest.values())
+    return hashlib.sha1(data).hexdigest()
+
+
+def init_app(app):
+    digest = load(app.config['ASSETS_DIR'])
+    if digest is not None:
+        # Pages link to the built files, so a new build changes them too.
+        app.config['ETAG_SALT'] = '{}:{}'.format(app.config['ETAG_SALT'], digest)
+    app.add_url_rule(app.config['ASSETS_URL_PATH'] + '/<path:filename>', 'assets', serve)
+    app.jinja_env.globals['static_url'] = static_url
+    app.cli.add_command(build_assets_command)
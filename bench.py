@@ -0,0 +1,736 @@
+"""Seed a synthetic catalog into a local database and time routes against it.
+
+    python bench.py --venues 2000 --artists 2000 --shows 20000 /venues
+    python bench.py --scale 1k 10k 100k --output results.json
+    python bench.py --scale 10k --compare results.json
+    python bench.py --explain
+    python bench.py --scale 10k 100k 1m --ranges
+
+The catalog is deterministic (seeded RNG, show times relative to now) and is
+written to a throwaway SQLite file unless --database is given, in which case
+its tables are dropped and recreated. --scale runs the whole suite once per
+scale factor, a number of shows (with a tenth as many venues and artists).
+
+Every route of app.py is driven through the test client, the writes last
+(deleting a venue or an availability window is left out, since it can only
+succeed once). For each route the p50/p95 latency over --repeat requests,
+the SQL statements per request and the peak memory Python allocates while
+serving it are reported,
+along with the size of the response as sent to a client accepting
+compression, the compression ratio and the CPU time compressing it takes
+(see compression.py).
+A route written as "POST /venues/search?search_term=x" is posted with the
+query string as form data.
+
+The run exits with status 1 if a route answers with a server error.
+--replica copies the seeded SQLite file after seeding and registers the copy
+as a read replica; the replica column counts the statements sent to it.
+Writes made by the suite only reach the primary, as on a lagging replica.
+
+--output stores the results as JSON. --compare reads such a file and flags
+routes whose median latency or peak memory grew by more than --threshold,
+or that run more statements than before, exiting with status 1 if any did.
+
+--filter times the `datetime` Jinja filter against the implementation it
+replaced (dateutil parsing plus an uncompiled Babel pattern per call) over
+--values start times, and checks both produce the same text.
+
+--cold-start instead starts fresh interpreters (--runs of them) and reports
+the median time to import app.py and build the app, then the latency of the
+first and second requests to a few pages (the gap is template compilation),
+the peak resident memory, and the memory a worker forked from the app does
+not share with it after serving them. It compares compiling templates on
+first use, loading them from a bytecode cache, and warming modules and
+templates up before serving as wsgi.py does (see templating.py).
+
+--ranges instead runs the queries of the show listings filtered by date
+range (tonight, this weekend, a week) again and reports the rows they return,
+the work they do (SQLite VM instructions, Postgres buffers) and their plans
+for shows, next to the number of shows in the range. Run at several --scale
+factors, the work follows the shows in the range (and the page size), not
+the size of the table: only the range is read.
+
+--explain instead runs EXPLAIN on every SELECT the routes issue and exits
+with status 1 if any of them scans a whole guarded table (shows,
+availabilities, venues and artists, by default) instead of using an index.
+On SQLite the in-process search indexes are loaded before, not checked, and
+the genre filter may scan artists (see SQLITE_SCANS).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import parse_qsl, urlsplit
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine, make_url
+from werkzeug.datastructures import MultiDict
+import babel.dates
+import dateutil.parser
+import changes
+import compression
+import search
+from app import create_app, format_datetime, _format_datetime, show_range
+from cache import detail_cache
+from fragments import fragment_cache
+from enums import State, Genre
+from models import db, Venue, Artist, Show, Availability, DEFAULT_SHOW_DURATION
+
+# The test client's sessions are thrown away; any fixed key will do.
+os.environ.setdefault('SECRET_KEY', 'bench')
+app = create_app()
+
+CITIES = [
+    'San Francisco', 'New York', 'Austin', 'Chicago', 'Seattle',
+    'Nashville', 'Denver', 'Boston', 'Portland', 'Atlanta'
+]
+CHUNK = 5000
+AVAILABILITY_WINDOWS = 5
+ROUTES = [
+    '/venues',
+    '/artists',
+    '/shows',
+    '/shows?when=tonight&city=Austin',
+    '/shows?when=weekend&state=TX',
+    '/shows?from={}&to={}&city=Austin'.format(
+        date.today().isoformat(), (date.today() + timedelta(days=6)).isoformat()),
+    '/venues/1',
+    '/artists/1',
+    '/venues/1/past_shows',
+    '/artists/1/past_shows',
+    '/venues/1/edit',
+    '/artists/1/edit',
+    '/artists/1/availability',
+    '/',
+    '/venues/create',
+    '/artists/create',
+    '/shows/create',
+    '/api/v1/venues?state=NY',
+    '/api/v1/artists?genre=Jazz&fields=id,name',
+    '/api/v1/artists?state=NY&seeking_venue=true&available_on={}&fields=id,name'.format(
+        (date.today() + timedelta(days=30)).isoformat()),
+    '/api/v1/shows?city=Austin',
+    '/metrics/cache',
+    '/metrics/pool',
+    'POST /venues/search?search_term=Venue 1',
+    'POST /artists/search?search_term=Artist 1',
+    'POST /venues/create?name=Bench Venue&city=Austin&state=TX&address=1 Main St'
+    '&phone=512-555-0100&genres=Jazz&genres=Folk&facebook_link=https://facebook.com/bench',
+    'POST /artists/create?name=Bench Artist&city=Austin&state=TX'
+    '&phone=512-555-0100&genres=Jazz&facebook_link=https://facebook.com/bench',
+    'POST /artists/1/availability?start_time=2030-01-01 00:00:00&end_time=2030-01-08 00:00:00',
+    'POST /shows/create?venue_id=1&artist_id=1&start_time=2030-01-01 20:00:00',
+    'POST /venues/1/edit?name=Venue 1&city=Austin&state=TX&address=1 Main St'
+    '&phone=512-555-0100&genres=Jazz&image_link=&facebook_link=https://facebook.com/v1'
+    '&website=&seeking_description=',
+    'POST /artists/1/edit?name=Artist 1&city=Austin&state=TX&phone=512-555-0100'
+    '&genres=Jazz&image_link=&facebook_link=https://facebook.com/a1'
+    '&website_link=&seeking_description=',
+]
+# Routes deliberately not driven by the suite.
+SKIPPED = {'delete_venue', 'delete_availability', 'static', 'assets'}
+
+# Guarded tables --explain lets a route scan on SQLite, which has no index
+# for it: genres are a JSON list there, matched with LIKE. Postgres answers
+# the same filter from the GIN index on genres, so it stays guarded there.
+SQLITE_SCANS = {'/api/v1/artists?genre=Jazz&fields=id,name': {'artists'}}
+SCALES = {'k': 1000, 'm': 1000000}
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), CHUNK):
+        yield rows[i:i + CHUNK]
+
+
+def seed(venues, artists, shows, seed=42):
+    rnd = random.Random(seed)
+    states = [item.value for item in State]
+    genres = [item.value for item in Genre]
+    now = datetime.now().replace(microsecond=0)
+
+    db.drop_all()
+    db.create_all()
+
+    venue_rows = [{
+        'id': i,
+        'name': 'Venue {}'.format(i),
+        'city': rnd.choice(CITIES),
+        'state': rnd.choice(states),
+        'address': '{} Main St'.format(i),
+        'phone': '555-555-5555',
+        'genres': rnd.sample(genres, 2),
+        'image_link': 'https://example.com/venues/{}.jpg'.format(i),
+        'seeking_talent': rnd.random() < 0.5
+    } for i in range(1, venues + 1)]
+
+    artist_rows = [{
+        'id': i,
+        'name': 'Artist {}'.format(i),
+        'city': rnd.choice(CITIES),
+        'state': rnd.choice(states),
+        'phone': '555-555-5555',
+        'genres': rnd.sample(genres, 2),
+        'image_link': 'https://example.com/artists/{}.jpg'.format(i),
+        'seeking_venue': rnd.random() < 0.5
+    } for i in range(1, artists + 1)]
+
+    # Two hour shows on the hour; a venue or artist can't have two at once,
+    # so draws landing within an hour of a booked show are drawn again.
+    booked = set()
+    show_rows = []
+    while len(show_rows) < shows:
+        venue_id, artist_id = rnd.randint(1, venues), rnd.randint(1, artists)
+        hour = rnd.randint(-24 * 365, 24 * 365)
+        if any((owner, hour + offset) in booked
+               for owner in (('v', venue_id), ('a', artist_id)) for offset in (-1, 0, 1)):
+            continue
+        booked.update(((('v', venue_id), hour), (('a', artist_id), hour)))
+        start_time = now + timedelta(hours=hour)
+        show_rows.append({
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time,
+            'end_time': start_time + DEFAULT_SHOW_DURATION
+        })
+    # Written in start time order, as shows booked over time roughly are.
+    show_rows.sort(key=lambda row: row['start_time'])
+    for i, row in enumerate(show_rows, 1):
+        row['id'] = i
+
+    # A few availability windows (a day to a month long) per artist.
+    availability_rows = []
+    for artist_id in range(1, artists + 1):
+        for _ in range(AVAILABILITY_WINDOWS):
+            start_time = now + timedelta(days=rnd.randint(-365, 365))
+            availability_rows.append({
+                'id': len(availability_rows) + 1,
+                'artist_id': artist_id,
+                'start_time': start_time,
+                'end_time': start_time + timedelta(days=rnd.randint(1, 30))
+            })
+
+    for table, rows in ((Venue.__table__, venue_rows),
+                        (Artist.__table__, artist_rows),
+                        (Show.__table__, show_rows),
+                        (Availability.__table__, availability_rows)):
+        for chunk in _chunks(rows):
+            db.session.execute(table.insert(), chunk)
+    db.session.commit()
+
+    # Core inserts bypass the ORM events, so announce the new data ourselves.
+    changes.publish({('venues', None), ('artists', None), ('shows', None), ('availabilities', None)})
+
+
+def request(client, route, headers=None):
+    if route.startswith('POST '):
+        url = urlsplit(route[len('POST '):])
+        return client.post(url.path, data=MultiDict(parse_qsl(url.query, keep_blank_values=True)),
+                           headers=headers)
+    return client.get(route, headers=headers)
+
+
+def uncovered(routes):
+    """Endpoints of app.py that none of ``routes`` reaches."""
+    adapter = app.url_map.bind('localhost')
+    reached = set()
+    for route in routes:
+        method = 'POST' if route.startswith('POST ') else 'GET'
+        path = urlsplit(route[len('POST '):] if method == 'POST' else route).path
+        reached.add(adapter.match(path, method=method)[0])
+    return sorted({rule.endpoint for rule in app.url_map.iter_rules()} - reached - SKIPPED)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of the sorted ``values``."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def measure(client, path, repeat):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(conn.engine.url)
+
+    # One untimed request first, so template compilation and other one-off
+    # work does not land in the percentiles.
+    request(client, path).get_data()
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    try:
+        timings = []
+        for _ in range(repeat):
+            del statements[:]
+            start = time.perf_counter()
+            response = request(client, path)
+            response.get_data()
+            timings.append(time.perf_counter() - start)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+
+    # Tracing allocations slows everything down, so memory gets its own run.
+    tracemalloc.start()
+    try:
+        request(client, path).get_data()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # The same request from a client accepting compression, and the CPU time
+    # compressing the body takes.
+    encoded = request(client, path, {'Accept-Encoding': ', '.join(compression.encodings())})
+    encoding = encoded.headers.get('Content-Encoding')
+    cpu = []
+    if encoding:
+        for _ in range(min(repeat, 5)):
+            start = time.process_time()
+            compression.compress(response.data, encoding, app.config)
+            cpu.append(time.process_time() - start)
+    cpu.sort()
+
+    timings.sort()
+    return {
+        'path': path,
+        'status': response.status_code,
+        'statements': len(statements),
+        'replica_statements': sum(1 for url in statements if str(url) != app.config['SQLALCHEMY_DATABASE_URI']),
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'peak_kb': peak / 1024,
+        'bytes': len(response.data),
+        'encoding': encoding,
+        'encoded_bytes': len(encoded.data),
+        'compress_ms': percentile(cpu, 50) * 1000 if cpu else 0.0,
+    }
+
+
+def regressions(results, baseline, threshold):
+    """Compare ``results`` with an earlier run; yield (scale, path, reason)."""
+    before = {(result['scale'], result['path']): result for result in baseline['results']}
+    for result in results:
+        old = before.get((result['scale'], result['path']))
+        if old is None:
+            continue
+        if result['statements'] > old['statements']:
+            yield result['scale'], result['path'], 'statements {} -> {}'.format(
+                old['statements'], result['statements'])
+        # p95 over a few dozen requests is too noisy to gate on; the median
+        # is not, once millisecond-level jitter on fast routes is ignored.
+        if result['p50_ms'] > old['p50_ms'] * (1 + threshold) and result['p50_ms'] - old['p50_ms'] > 1:
+            yield result['scale'], result['path'], 'p50 {:.1f}ms -> {:.1f}ms'.format(
+                old['p50_ms'], result['p50_ms'])
+        if result['peak_kb'] > old['peak_kb'] * (1 + threshold) and result['peak_kb'] - old['peak_kb'] > 64:
+            yield result['scale'], result['path'], 'peak memory {:.0f}KB -> {:.0f}KB'.format(
+                old['peak_kb'], result['peak_kb'])
+
+
+def scale(value):
+    """Parse a scale factor such as 10k into a number of shows."""
+    value = value.lower()
+    if value[-1:] in SCALES:
+        return int(float(value[:-1]) * SCALES[value[-1]])
+    return int(value)
+
+
+def selects(client, route):
+    """The SELECT statements, with their parameters, serving ``route`` runs."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    detail_cache.clear()
+    event.listen(Engine, 'before_cursor_execute', capture)
+    try:
+        # Read the body too: the API streams it, querying as it goes.
+        request(client, route).get_data()
+    finally:
+        event.remove(Engine, 'before_cursor_execute', capture)
+    return statements
+
+
+def explain(client, route, tables):
+    """Return the plan lines of ``route``'s queries that scan one of
+    ``tables`` without an index."""
+    statements = selects(client, route)
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            tables = [table for table in tables if table not in SQLITE_SCANS.get(route, ())]
+        if not tables:
+            return len(statements), []
+        if dialect == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+            # A plain SCAN, or an automatic index SQLite builds by scanning
+            # the table first, both read every row.
+            scan = re.compile(
+                r'^(?:SCAN (?:TABLE )?({0})(?:_\d+)?\b(?!.*USING)'
+                r'|SEARCH (?:TABLE )?({0})(?:_\d+)?\b.* USING AUTOMATIC)'.format('|'.join(tables)))
+        else:
+            prefix = 'EXPLAIN '
+            scan = re.compile(r'Seq Scan on ({})\b'.format('|'.join(tables)))
+
+        problems = []
+        with db.engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+                for line in plan:
+                    detail = line[-1]
+                    if scan.search(detail.strip()):
+                        problems.append((statement, detail.strip()))
+        return len(statements), problems
+
+
+# Listings --ranges reports on: date ranges (and the full listing, for
+# reference), whose cost should not grow with the shows outside the range.
+RANGE_ROUTES = ['/shows'] + [route for route in ROUTES if route.startswith('/shows?')]
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _plan_nodes(child)
+
+
+def in_range(route):
+    """Number of shows, in any city, in the date range ``route`` asks for."""
+    start, end = show_range(MultiDict(parse_qsl(urlsplit(route).query)), datetime.now())
+    query = db.session.query(func.count(Show.id))
+    if start:
+        query = query.filter(Show.start_time >= start)
+    if end:
+        query = query.filter(Show.start_time < end)
+    return query.scalar()
+
+
+def range_work(client, route):
+    """Run ``route``'s queries again, measuring them; returns (rows, work,
+    plan lines for shows). Work is VM instructions on SQLite and buffers
+    (8KB pages) touched on Postgres."""
+    statements = selects(client, route)
+    rows = work = 0
+    plan = []
+    with app.app_context(), db.engine.connect() as conn:
+        if db.engine.dialect.name == 'sqlite':
+            steps = []
+            raw = conn.connection.dbapi_connection
+            raw.set_progress_handler(lambda: steps.append(1) and 0, 100)
+            try:
+                for statement, parameters in statements:
+                    rows += len(conn.exec_driver_sql(statement, parameters).fetchall())
+            finally:
+                raw.set_progress_handler(None, 0)
+            work = len(steps) * 100
+            for statement, parameters in statements:
+                plan += [line[-1] for line in conn.exec_driver_sql(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters) if 'shows' in line[-1]]
+        else:
+            for statement, parameters in statements:
+                result, = conn.exec_driver_sql(
+                    'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + statement, parameters).scalar()
+                rows += result['Plan']['Actual Rows']
+                work += result['Plan'].get('Shared Hit Blocks', 0) + result['Plan'].get('Shared Read Blocks', 0)
+                plan += ['{} on shows{}'.format(node['Node Type'], ' using ' + node['Index Name']
+                                                if 'Index Name' in node else '')
+                         for node in _plan_nodes(result['Plan']) if node.get('Relation Name') == 'shows']
+    return rows, work, plan
+
+
+# Pages --cold-start requests right after start-up; they need no database.
+COLD_START_PAGES = ['/', '/venues/create', '/artists/create', '/shows/create']
+
+# Run in a fresh interpreter by cold_start(), which prepends MODE.
+COLD_START = '''
+import json, os, resource, sys, time
+started = time.perf_counter()
+import app
+import templating
+imported = time.perf_counter()
+application = app.create_app()
+application.config['WTF_CSRF_ENABLED'] = False
+created = time.perf_counter()
+if MODE == 'warmup':
+    # As wsgi.py does.
+    app.preload()
+    templating.warmup(application)
+preloaded = time.perf_counter()
+client = application.test_client()
+timings = []
+for _ in range(2):
+    before = time.perf_counter()
+    for page in PAGES:
+        client.get(page)
+    timings.append(time.perf_counter() - before)
+
+
+def private_kb():
+    # Pages of this process no other process maps (Linux only).
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            return sum(int(line.split()[1]) for line in f if line.startswith('Private_'))
+    except OSError:
+        return None
+
+
+# A worker forked from the app as it stands, serving its pages once.
+read, write = os.pipe()
+pid = os.fork()
+if not pid:
+    os.close(read)
+    before = private_kb()
+    worker = application.test_client()
+    for page in PAGES:
+        worker.get(page)
+    after = private_kb()
+    os.write(write, json.dumps(None if before is None else after - before).encode())
+    os._exit(0)
+os.close(write)
+worker = json.loads(os.read(read, 64))
+os.waitpid(pid, 0)
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_ms': (created - imported) * 1000,
+    'warmup_ms': (preloaded - created) * 1000,
+    'first_requests_ms': timings[0] * 1000,
+    'warm_requests_ms': timings[1] * 1000,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'worker_private_kb': worker,
+}))
+'''
+
+COLD_START_MODES = {
+    # Templates compiled on first use, as without a bytecode cache.
+    'compile': False,
+    # Templates loaded from a bytecode cache filled beforehand.
+    'bytecode': True,
+    # Modules and templates loaded before the first request (wsgi.py).
+    'warmup': True,
+}
+
+
+def cold_start(runs):
+    cache_dir = tempfile.mkdtemp(prefix='fyyur-jinja-')
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    def start(mode):
+        env = dict(os.environ, SECRET_KEY='bench',
+                   TEMPLATE_BYTECODE_CACHE=cache_dir if COLD_START_MODES[mode] else '')
+        source = 'MODE = {!r}\nPAGES = {!r}\n'.format(mode, COLD_START_PAGES) + COLD_START
+        output = subprocess.run([sys.executable, '-c', source], cwd=directory, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        return json.loads(output.splitlines()[-1])
+
+    try:
+        # Fills the bytecode cache, like `flask compile-templates` at build time.
+        start('bytecode')
+        print('first and second requests to {}'.format(', '.join(COLD_START_PAGES)))
+        for mode in COLD_START_MODES:
+            samples = [start(mode) for _ in range(runs)]
+            medians = {}
+            for key in samples[0]:
+                values = [sample[key] for sample in samples if sample[key] is not None]
+                medians[key] = statistics.median(values) if values else float('nan')
+            print('{:<9} import {import_ms:6.1f} ms  create_app {create_ms:5.1f} ms  '
+                  'warmup {warmup_ms:5.1f} ms  first {first_requests_ms:6.1f} ms  '
+                  'second {warm_requests_ms:5.1f} ms  max RSS {max_rss_kb:6.0f} KB  '
+                  'worker private {worker_private_kb:6.0f} KB'.format(mode, **medians))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def bench_filter(count, seed=42):
+    # Start times on the hour over two years, like the seeded catalog: a
+    # listing repeats many of them.
+    rnd = random.Random(seed)
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    values = [now + timedelta(hours=rnd.randint(-24 * 365, 24 * 365)) for _ in range(count)]
+    strings = [value.strftime('%m %d %Y, %H:%M') for value in values]
+
+    start = time.perf_counter()
+    legacy = [legacy_format_datetime(value, 'full') for value in strings]
+    legacy_time = time.perf_counter() - start
+
+    _format_datetime.cache_clear()
+    start = time.perf_counter()
+    current = [format_datetime(value, 'full') for value in values]
+    current_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    [format_datetime(value, 'full') for value in values]
+    warm_time = time.perf_counter() - start
+
+    print('{:<36} {:>10} {:>12}'.format('datetime filter', 'total s', 'us/value'))
+    for label, elapsed in (('dateutil + babel (old)', legacy_time),
+                           ('compiled + memoized, cold', current_time),
+                           ('compiled + memoized, warm', warm_time)):
+        print('{:<36} {:>10.2f} {:>12.2f}'.format(label, elapsed, elapsed / count * 1e6))
+    print('identical output: {}'.format(legacy == current))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', default=ROUTES)
+    parser.add_argument('--database', help='SQLAlchemy URI (default: temporary SQLite file)')
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--scale', nargs='+', type=scale,
+                        help='run once per number of shows, e.g. 1k 10k 100k')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--replica', action='store_true',
+                        help='serve reads from a copy of the seeded SQLite file, standing in for a replica')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the data already in --database')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='flag regressions against this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='relative growth flagged by --compare (default 0.5)')
+    parser.add_argument('--explain', action='store_true', help='fail on full table scans instead of timing')
+    parser.add_argument('--guard', nargs='+', default=['shows', 'availabilities', 'venues', 'artists'],
+                        help='tables --explain must never scan')
+    parser.add_argument('--ranges', action='store_true',
+                        help='report the work the date range listings do instead of timing')
+    parser.add_argument('--filter', action='store_true', help='benchmark the datetime filter instead')
+    parser.add_argument('--values', type=int, default=100000, help='number of values for --filter')
+    parser.add_argument('--cold-start', action='store_true', help='measure start-up time and memory instead')
+    parser.add_argument('--runs', type=int, default=5, help='interpreters started by --cold-start')
+    args = parser.parse_args()
+
+    if args.filter:
+        bench_filter(args.values)
+        return
+    if args.cold_start:
+        cold_start(args.runs)
+        return
+
+    tmpdir = None
+    if not args.database:
+        tmpdir = tempfile.mkdtemp(prefix='fyyur-bench-')
+        args.database = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    app.config['WTF_CSRF_ENABLED'] = False
+    if args.replica:
+        primary = make_url(args.database)
+        if primary.get_backend_name() != 'sqlite':
+            parser.error('--replica needs a SQLite --database')
+        replica = primary.database + '.replica'
+        app.config['SQLALCHEMY_BINDS'] = {'replica': 'sqlite:///' + replica}
+        app.config['REPLICA_BINDS'] = ['replica']
+
+    if args.scale:
+        catalogs = [(max(shows // 10, 1), max(shows // 10, 1), shows) for shows in args.scale]
+    else:
+        catalogs = [(args.venues, args.artists, args.shows)]
+
+    missing = uncovered(args.paths) if args.paths == ROUTES else []
+    if missing:
+        print('not benchmarked: {}'.format(', '.join(missing)))
+
+    results = []
+    failed = False
+    for venues, artists, shows in catalogs:
+        with app.app_context():
+            if not args.no_seed:
+                start = time.perf_counter()
+                seed(venues, artists, shows)
+                print('seeded {} venues, {} artists, {} shows in {:.1f}s'.format(
+                    venues, artists, shows, time.perf_counter() - start))
+            if args.replica:
+                db.get_engine(app, bind='replica').dispose()
+                shutil.copyfile(primary.database, replica)
+        detail_cache.clear()
+        fragment_cache.clear()
+
+        # Requests run outside the seeding context so each one gets a fresh
+        # session, exactly like in production.
+        client = app.test_client()
+
+        if args.ranges:
+            unit = 'VM steps' if make_url(args.database).get_backend_name() == 'sqlite' else 'buffers'
+            print('{:<45} {:>8} {:>6} {:>10}  {}'.format(
+                'route ({} shows)'.format(shows), 'in range', 'rows', unit, 'plan'))
+            for path in RANGE_ROUTES:
+                rows, work, plan = range_work(client, path)
+                with app.app_context():
+                    count = in_range(path)
+                print('{:<45} {:>8} {:>6} {:>10}  {}'.format(path[:45], count, rows, work, '; '.join(plan)))
+            continue
+
+        if args.explain:
+            # Loading the SQLite search indexes reads whole tables, once per
+            # process; only what each request runs is checked.
+            with app.app_context():
+                search.load()
+            for path in args.paths:
+                count, problems = explain(client, path, args.guard)
+                print('{:<45} {:>3} queries  {}'.format(path, count, 'FAIL' if problems else 'ok'))
+                for statement, detail in problems:
+                    failed = True
+                    print('    {}\n        {}'.format(detail, ' '.join(statement.split())))
+            continue
+
+        print('{:<45} {:>6} {:>10} {:>9} {:>9} {:>9} {:>9} {:>8}'.format(
+            'route', 'status', 'statements', 'p50 ms', 'p95 ms', 'peak KB', 'bytes', 'replica')
+            + ' {:>9} {:>6} {:>7}'.format('encoded', 'ratio', 'zip ms'))
+        for path in args.paths:
+            result = measure(client, path, args.repeat)
+            result['scale'] = shows
+            results.append(result)
+            print('{:<45} {status:>6} {statements:>10} {p50_ms:>9.1f} {p95_ms:>9.1f} '
+                  '{peak_kb:>9.0f} {bytes:>9} {replica_statements:>8} {encoded_bytes:>9} {ratio:>6.1f} '
+                  '{compress_ms:>7.2f}'.format(path[:45], ratio=result['bytes'] / max(result['encoded_bytes'], 1),
+                                               **result))
+
+    if args.explain:
+        sys.exit(1 if failed else 0)
+
+    run = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'database': args.database.split(':', 1)[0],
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    errors = [result for result in results if result['status'] >= 500]
+    for result in errors:
+        print('ERROR {} shows {}: status {}'.format(result['scale'], result['path'], result['status']))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        flagged = list(regressions(results, baseline, args.threshold))
+        for shows, path, reason in flagged:
+            print('REGRESSION {} shows {}: {}'.format(shows, path, reason))
+        if not flagged:
+            print('no regressions against {}'.format(args.compare))
+        errors += flagged
+
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Keep venues and artists from being booked for two shows at once.
+
+A show occupies ``[start_time, end_time)``. On Postgres the exclusion
+constraints on shows (see models.py) are what guarantees no two of a venue's
+or an artist's shows overlap; on SQLite nothing in the database does, and
+this module is the check. Both dialects use it before writing, so a
+conflict is reported with the show it collides with instead of as a failed
+insert. A check is only good until the show is written, so bookings take
+``lock()`` first: on SQLite that is what keeps two workers from both
+passing it and double-booking.
+
+The shows of a venue or an artist are kept in a ``Timeline``: start times
+sorted, with the running maximum of the end times, so whether an interval
+overlaps any of them is a binary search however many shows there are.
+Timelines are loaded one query per venue/artist, cached (``calendar``) and
+reloaded when the version stamp of the venue or artist changes, which every
+write to one of its shows does (see changes.py). A show booked through the
+calendar is added to the cached timelines along with their new stamps, so
+booking doesn't make the next check reload them.
+
+``flask import`` checks a whole file against a ``Calendar`` of its own,
+which loads the timelines of each batch's venues and artists in one query
+per table and adds the accepted rows as it goes, so rows of the same file
+can't collide either.
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+from sqlalchemy import select
+import changes
+import versions
+from models import db, Artist, Show, Venue
+
+shows = Show.__table__
+
+# SQLSTATE of a violated exclusion constraint.
+EXCLUSION_VIOLATION = '23P01'
+
+# Timelines kept by the in-process calendar.
+CALENDAR_SIZE = 10000
+
+# Column of shows each kind of timeline is keyed on.
+OWNERS = {
+    'venues': shows.c.venue_id,
+    'artists': shows.c.artist_id,
+}
+
+
+class Timeline:
+    """The shows of one venue or artist, by start time."""
+
+    def __init__(self, rows=()):
+        # (start, end, show id), sorted by start.
+        self._shows = sorted(rows)
+        self._reach = []
+        self._extend(0)
+
+    def _extend(self, index):
+        # _reach[i] is the latest end among the first i + 1 shows.
+        del self._reach[index:]
+        reach = self._reach[-1] if self._reach else None
+        for start, end, id in self._shows[index:]:
+            reach = end if reach is None or end > reach else reach
+            self._reach.append(reach)
+
+    def __len__(self):
+        return len(self._shows)
+
+    def conflict(self, start, end):
+        """``(start, end, id)`` of a show overlapping ``[start, end)``, or None.
+
+        Shows added without an id (not written yet) have an id of None.
+        """
+        # Shows starting before ``end``; one of them overlaps if any ends
+        # after ``start``.
+        index = bisect_left(self._shows, (end,))
+        if not index or self._reach[index - 1] <= start:
+            return None
+        for index in range(index - 1, -1, -1):
+            if self._shows[index][1] > start:
+                return self._shows[index]
+
+    def __contains__(self, row):
+        index = bisect_left(self._shows, row)
+        return index < len(self._shows) and self._shows[index] == row
+
+    def add(self, start, end, id=None):
+        row = (start, end, id)
+        index = bisect_left(self._shows, row)
+        self._shows.insert(index, row)
+        self._extend(index)
+
+
+class Calendar:
+    """Timelines of venues and artists, keyed ``(table, id)``."""
+
+    def __init__(self, connection=None):
+        self.connection = connection
+        self.timelines = {}
+
+    def load(self, keys):
+        """Read the timelines of ``keys`` not loaded yet."""
+        missing = {key for key in keys if key not in self.timelines}
+        for table, owner in OWNERS.items():
+            ids = sorted(id for table_, id in missing if table_ == table)
+            if not ids:
+                continue
+            rows = {id: [] for id in ids}
+            statement = select(owner, shows.c.start_time, shows.c.end_time, shows.c.id) \
+                .where(owner.in_(ids))
+            for id, start, end, show_id in (self.connection or db.session).execute(statement):
+                rows[id].append((start, end, show_id))
+            self.timelines.update(((table, id), Timeline(rows[id])) for id in ids)
+
+    def conflict(self, values):
+        """``(table, id, show id)`` of a booking ``values`` collides with, or None."""
+        for table, owner in OWNERS.items():
+            timeline = self.timelines[(table, values[owner.name])]
+            show = timeline.conflict(values['start_time'], values['end_time'])
+            if show is not None:
+                return table, values[owner.name], show[2]
+        return None
+
+    def add(self, values):
+        for table, owner in OWNERS.items():
+            self.timelines[(table, values[owner.name])].add(
+                values['start_time'], values['end_time'], values.get('id'))
+
+
+def lock(values):
+    """Hold off other bookings of the venue and artist in ``values`` until
+    the current transaction ends.
+
+    Postgres locks the two rows (SELECT ... FOR UPDATE). SQLite has a single
+    writer, so the transaction takes the database's write lock up front
+    (BEGIN IMMEDIATE) instead of at its first write; that only works while
+    the session hasn't written anything yet.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+            connection.execute(select(model.id).where(model.id == values[key]).with_for_update())
+    elif connection.dialect.name == 'sqlite' and not connection.connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def overlapping(error):
+    """Whether an IntegrityError is Postgres refusing overlapping shows."""
+    return getattr(error.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
+
+def booking_keys(values):
+    return [(table, values[owner.name]) for table, owner in OWNERS.items()]
+
+
+class CachedCalendar:
+    """Timelines shared by the requests of a process, checked against stamps."""
+
+    def __init__(self, maxsize=CALENDAR_SIZE):
+        self.maxsize = maxsize
+        self._lock = Lock()
+        # (table, id) -> (stamp, Timeline)
+        self._timelines = OrderedDict()
+
+    def conflict(self, values):
+        keys = booking_keys(values)
+        current = versions.stamps(keys)
+        calendar = Calendar()
+        with self._lock:
+            for key in keys:
+                entry = self._timelines.get(key)
+                if entry is not None and entry[0] == current[key]:
+                    self._timelines.move_to_end(key)
+                    calendar.timelines[key] = entry[1]
+        calendar.load(keys)
+        with self._lock:
+            for key in keys:
+                self._timelines[key] = (current[key], calendar.timelines[key])
+                self._timelines.move_to_end(key)
+            while len(self._timelines) > self.maxsize:
+                self._timelines.popitem(last=False)
+            return calendar.conflict(values)
+
+    def add(self, values):
+        """Add a show just written to the cached timelines of its venue and
+        artist, instead of letting its stamps force them to be reloaded.
+
+        A timeline is only updated if the write was the one change to it
+        since it was read: the stamp moved by exactly one and the show isn't
+        in it yet. Others are left to be reloaded.
+        """
+        keys = booking_keys(values)
+        current = versions.stamps(keys)
+        row = (values['start_time'], values['end_time'], values['id'])
+        with self._lock:
+            for key in keys:
+                entry = self._timelines.get(key)
+                if entry is None or current[key] != entry[0] + 1 or row in entry[1]:
+                    continue
+                entry[1].add(*row)
+                self._timelines[key] = (current[key], entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._timelines.clear()
+
+
+calendar = CachedCalendar()
+
+
+@changes.subscribe
+def _drop_bulk_loaded(keys):
+    # Bulk loads don't bump per-row stamps, so the timelines can't tell.
+    if ('shows', None) in keys:
+        calendar.clear()
@@ -0,0 +1,150 @@
+"""In-process cache for assembled view models.
+
+Entries are bounded (least recently used ones are evicted first) and expire
+after a TTL. For a grace period after that, the expired value is still
+served while a background thread rebuilds it (stale-while-revalidate).
+
+Every entry carries the ``(table, id)`` tags it was built from. When
+changes.py reports a commit touching one of those rows, the entry is dropped
+at once rather than waiting for the TTL. Callers that know which version of
+the data they need (the stamps from versions.py) pass it along, and an entry
+built from any other version is rebuilt; that also covers writes made by
+other processes, which changes.py never hears about.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+import changes
+
+Entry = namedtuple('Entry', ['value', 'tags', 'version', 'fresh_until', 'stale_until'])
+
+
+def _spawn(fn):
+    threading.Thread(target=fn, daemon=True).start()
+
+
+class ViewCache:
+
+    def __init__(self, maxsize=1000, ttl=60, stale_ttl=300, context=None, spawn=_spawn):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # Context manager factory the background rebuilds run in (the Flask
+        # app context, so they get their own database session).
+        self.context = context
+        self.spawn = spawn
+        self.lock = threading.RLock()
+        self.counters = Counter()
+        self._entries = OrderedDict()
+        self._tags = defaultdict(set)
+        self._refreshing = set()
+        # Bumped by every invalidation. A value built while it changed may
+        # have read rows that are already outdated, so it is not stored.
+        self._epoch = 0
+        changes.subscribe(self.invalidate_tags)
+
+    def get(self, key, build, version=None, ttl=None):
+        """Return the cached value for ``key``, calling ``build()`` on a miss.
+
+        ``build`` returns ``(value, tags)``; exceptions it raises (e.g. a 404)
+        propagate and nothing is cached. An entry stored with a different
+        ``version`` counts as a miss. ``ttl`` overrides the cache's own.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                if now < entry.fresh_until:
+                    self.counters['hits'] += 1
+                else:
+                    self.counters['stale_hits'] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        epoch = self._epoch
+                        self.spawn(lambda: self._refresh(key, build, version, epoch, ttl))
+                return entry.value
+            self.counters['misses'] += 1
+            epoch = self._epoch
+
+        value, tags = build()
+        self._store(key, value, tags, version, epoch, ttl)
+        return value
+
+    def _refresh(self, key, build, version, epoch, ttl):
+        try:
+            if self.context is not None:
+                with self.context():
+                    value, tags = build()
+            else:
+                value, tags = build()
+        except Exception:
+            with self.lock:
+                self._drop(key)
+            return
+        finally:
+            with self.lock:
+                self._refreshing.discard(key)
+        self.counters['refreshes'] += 1
+        self._store(key, value, tags, version, epoch, ttl)
+
+    def _store(self, key, value, tags, version, epoch, ttl=None):
+        now = time.monotonic()
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            if epoch != self._epoch:
+                return
+            self._drop(key)
+            tags = frozenset(tags)
+            self._entries[key] = Entry(value, tags, version, now + ttl, now + ttl + self.stale_ttl)
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for tag in entry.tags:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+        return entry
+
+    def invalidate_tags(self, tags):
+        with self.lock:
+            self._epoch += 1
+            keys = set()
+            for tag in tags:
+                if tag[1] is None:
+                    for other, tagged in self._tags.items():
+                        if other[0] == tag[0]:
+                            keys |= tagged
+                else:
+                    keys |= self._tags.get(tag, set())
+            for key in keys:
+                if self._drop(key) is not None:
+                    self.counters['invalidations'] += 1
+
+    def clear(self):
+        with self.lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, size=len(self._entries), maxsize=self.maxsize)
+
+
+detail_cache = ViewCache()
+
+
+def init_app(app):
+    detail_cache.maxsize = app.config['DETAIL_CACHE_SIZE']
+    detail_cache.ttl = app.config['DETAIL_CACHE_TTL']
+    detail_cache.stale_ttl = app.config['DETAIL_CACHE_STALE_TTL']
+    detail_cache.context = app.app_context
@@ -0,0 +1,63 @@
+"""Tell interested parties which rows a transaction changed once it commits.
+
+Every flushed insert, update and delete is recorded as a ``(table, id)`` key.
+Rows that reference other rows also mark those as changed, so adding a show
+touches ``('shows', id)``, ``('venues', venue_id)`` and
+``('artists', artist_id)``. Keys are handed to subscribers after a successful
+commit and dropped on rollback.
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+_subscribers = []
+
+
+def subscribe(callback):
+    """Call ``callback(keys)`` after every commit that changed rows.
+
+    An id of None in a key means anything in that table may have changed,
+    which is what bulk loaders publish.
+    """
+    _subscribers.append(callback)
+    return callback
+
+
+def publish(keys):
+    keys = set(keys)
+    if keys:
+        for callback in list(_subscribers):
+            callback(keys)
+
+
+def row_keys(obj):
+    """The ``(table, id)`` keys a flushed ``obj`` changes."""
+    state = inspect(obj)
+    table = obj.__table__
+    keys = {(table.name, state.mapper.primary_key_from_instance(obj)[0])}
+
+    for fk in table.foreign_keys:
+        history = state.attrs[fk.parent.key].history
+        for value in history.sum() or [getattr(obj, fk.parent.key)]:
+            if value is not None:
+                # Form data is assigned as strings; key on the real id.
+                keys.add((fk.column.table.name, fk.column.type.python_type(value)))
+
+    return keys
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect(session, flush_context):
+    pending = session.info.setdefault('changed_rows', set())
+    for obj in session.new | session.dirty | session.deleted:
+        if hasattr(obj, '__table__'):
+            pending |= row_keys(obj)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    publish(session.info.pop('changed_rows', ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('changed_rows', None)
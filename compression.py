@@ -0,0 +1,155 @@
+"""Compress responses for clients that accept it.
+
+Responses of an allowed type (``COMPRESS_MIMETYPES``) are sent with brotli
+(when the brotli package is installed and the client prefers it) or gzip.
+Buffered bodies smaller than ``COMPRESS_MIN_SIZE`` bytes are left alone;
+larger ones are compressed at ``COMPRESS_LEVEL`` (gzip) or
+``COMPRESS_BROTLI_QUALITY``.
+
+Streamed responses (a generator, e.g. ``stream_with_context`` or the JSON
+API) are compressed as they are produced. Chunks are read until there are
+``COMPRESS_MIN_SIZE`` bytes before deciding: a stream that ends sooner is
+sent as is. Those first bytes are flushed at once, so the client gets the
+page head about as early as without compression, and after that output is
+flushed every ``COMPRESS_FLUSH_SIZE`` bytes of input.
+
+Files sent with send_file (static files, the precompressed /assets) and
+responses that already have a Content-Encoding are passed through.
+"""
+import zlib
+from itertools import chain
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class GzipCompressor:
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def encodings():
+    """Encodings this process can produce, most preferred first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compressor(encoding, config):
+    if encoding == 'br':
+        return BrotliCompressor(config['COMPRESS_BROTLI_QUALITY'])
+    return GzipCompressor(config['COMPRESS_LEVEL'])
+
+
+def compress(data, encoding, config):
+    c = compressor(encoding, config)
+    return c.compress(data) + c.finish()
+
+
+def _head(chunks, size):
+    """Read ``chunks`` until there are ``size`` bytes, and return them joined
+    with whether the stream ended before that."""
+    head = []
+    length = 0
+    for chunk in chunks:
+        head.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            return b''.join(head), False
+    return b''.join(head), True
+
+
+def _stream(chunks, c, flush_size):
+    pending = None
+    for chunk in chunks:
+        data = c.compress(chunk)
+        if pending is None:
+            pending = flush_size
+        else:
+            pending += len(chunk)
+        if pending >= flush_size:
+            data += c.flush()
+            pending = 0
+        if data:
+            yield data
+    yield c.finish()
+
+
+def _compressible(response, config):
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return False
+    return not response.cache_control.no_transform
+
+
+def init_app(app):
+    config = app.config
+    if not config['COMPRESS']:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if not _compressible(response, config):
+            return response
+        encoding = request.accept_encodings.best_match(encodings())
+        if encoding is None:
+            # Whether compressed or not, the response depends on the header.
+            response.vary.add('Accept-Encoding')
+            return response
+
+        if response.is_streamed:
+            original = response.response
+            if hasattr(original, 'close'):
+                response.call_on_close(original.close)
+            chunks = response.iter_encoded()
+            head, ended = _head(chunks, config['COMPRESS_MIN_SIZE'])
+            if ended:
+                response.set_data(head)
+                response.vary.add('Accept-Encoding')
+                return response
+            response.response = _stream(
+                chain([head], chunks), compressor(encoding, config), config['COMPRESS_FLUSH_SIZE'])
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < config['COMPRESS_MIN_SIZE']:
+                response.vary.add('Accept-Encoding')
+                return response
+            response.set_data(compress(data, encoding, config))
+
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # The compressed body is a different representation of the same page.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
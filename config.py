@@ -1,5 +1,7 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Must be the same in every worker and across restarts; create_app() only
+# falls back to a random per-process key with FLASK_ENV=development.
+SECRET_KEY = os.environ.get('SECRET_KEY')
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -11,4 +13,118 @@ DEBUG = True
 
 SQLALCHEMY_DATABASE_URI = 'postgresql://Bruno@localhost:5432/fyyur-database'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-# SQLALCHEMY_ECHO = True
\ No newline at end of file
+
+# Connection pool (see pooling.py). SQLite files ignore the sizing options.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+}
+
+# Statement timeout in milliseconds for the queries of a request (0: none),
+# and per-endpoint overrides, e.g.
+# DB_STATEMENT_TIMEOUTS="search_venues=2000,search_artists=2000".
+STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 10000))
+STATEMENT_TIMEOUTS = {
+    'search_venues': 3000,
+    'search_artists': 3000,
+}
+STATEMENT_TIMEOUTS.update(
+    (endpoint.strip(), int(timeout))
+    for endpoint, timeout in (
+        item.split('=') for item in os.environ.get('DB_STATEMENT_TIMEOUTS', '').split(',') if item.strip()))
+
+# SQLALCHEMY_ECHO = True
+
+# Rows per page on the venue, artist and show listings.
+ITEMS_PER_PAGE = 50
+
+# Maximum number of ranked results returned by the venue and artist search.
+SEARCH_RESULT_LIMIT = 50
+
+# Assembled venue/artist detail pages: how many are kept, how long (seconds)
+# they are served as-is, and for how long after that a stale copy is served
+# while it is rebuilt in the background.
+DETAIL_CACHE_SIZE = 1000
+DETAIL_CACHE_TTL = 60
+DETAIL_CACHE_STALE_TTL = 300
+
+# Rendered template fragments ({% cache %}, see fragments.py): how many are
+# kept and for how long (seconds) unless the tag gives its own TTL.
+FRAGMENT_CACHE = True
+FRAGMENT_CACHE_SIZE = 5000
+FRAGMENT_CACHE_TTL = 3600
+
+# Log a warning whenever a relationship is lazy loaded during a request, so
+# N+1 patterns show up while developing (see profiles.py).
+WARN_ON_LAZY_LOAD = DEBUG
+
+# Venue/artist pages list at most this many upcoming shows, and page through
+# past shows (newest first) this many at a time.
+UPCOMING_SHOWS_LIMIT = 12
+PAST_SHOWS_PER_PAGE = 12
+
+# Rows written per INSERT/COPY (and per transaction) by `flask import`.
+IMPORT_BATCH_SIZE = 1000
+
+# Rows fetched from the server-side cursor at a time by `flask export`.
+EXPORT_CHUNK_SIZE = 5000
+
+# Conditional GET (see versions.py): read pages carry an ETag and
+# Last-Modified derived from version stamps, and revalidations that still
+# match get a 304. Behind a caching reverse proxy, e.g.
+# 'public, max-age=0, s-maxage=30' lets it serve a page for 30 seconds and
+# revalidate it after that. ETAG_SALT defaults to a digest of the templates.
+CONDITIONAL_GET = True
+CONDITIONAL_GET_CACHE_CONTROL = 'no-cache'
+ETAG_SALT = None
+
+# Per-request SQL/Jinja/Python timings as a Server-Timing header and a JSON
+# log line (see instrumentation.py). Requests running more statements than
+# QUERY_BUDGET, or than their endpoint's entry in QUERY_BUDGETS, are logged
+# as warnings.
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION') == '1'
+QUERY_BUDGET = 10
+QUERY_BUDGETS = {}
+
+# Read replicas (see replicas.py): extra binds that GET requests and search
+# read from. After writing, a user reads from the primary for
+# REPLICA_LAG_TOLERANCE seconds, and a Postgres replica lagging by more than
+# that is skipped.
+SQLALCHEMY_BINDS = {}
+if os.environ.get('REPLICA_DATABASE_URL'):
+    SQLALCHEMY_BINDS['replica'] = os.environ['REPLICA_DATABASE_URL']
+REPLICA_BINDS = list(SQLALCHEMY_BINDS)
+REPLICA_ENDPOINTS = {'search_venues', 'search_artists'}
+REPLICA_LAG_TOLERANCE = 5
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+# Directory of compiled templates kept across restarts (see templating.py);
+# empty to compile in memory only. `flask compile-templates` fills it.
+TEMPLATE_BYTECODE_CACHE = os.environ.get(
+    'TEMPLATE_BYTECODE_CACHE', os.path.join(basedir, 'instance', 'jinja-cache'))
+
+# Fingerprinted, precompressed copies of static/ (see assets.py), built by
+# `flask build-assets` and served under ASSETS_URL_PATH.
+ASSETS_DIR = os.environ.get('ASSETS_DIR', os.path.join(basedir, 'instance', 'assets'))
+ASSETS_URL_PATH = '/assets'
+
+# Response compression (see compression.py): gzip, or brotli when installed.
+COMPRESS = True
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 4
+COMPRESS_FLUSH_SIZE = 8192
+COMPRESS_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+}
@@ -80,4 +80,14 @@ class Genre(Enum):
 
     @classmethod
     def items(cls):
-        return [(item.value, item.value) for item in cls]
\ No newline at end of file
+        return [(item.value, item.value) for item in cls]
+
+
+# Shared by forms.py and the bulk importer (importer.py), which applies the
+# same rules without building a form per row (or importing Flask-WTF).
+PHONE_REGEX = r'^(\+\d{1,2}\s?)?1?\-?\.?\s?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}$'
+STATES = [item.value for item in State]
+GENRES = [item.value for item in Genre]
+
+# Spellings of true accepted in imported files and query strings.
+TRUE_VALUES = {'y', 'yes', 'true', 't', 'on', '1'}
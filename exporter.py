@@ -0,0 +1,146 @@
+"""``flask export``: dump venues, artists or shows to CSV, JSONL or gzipped JSONL.
+
+    flask export venues venues.csv
+    flask export shows shows.jsonl.gz --chunk-size 20000
+
+Rows are read through a server-side cursor (a named cursor on Postgres) in
+chunks of ``--chunk-size`` and written out as they arrive, so memory use does
+not grow with the table. Shows carry their venue and artist names. The
+columns are the ones served by the JSON API (see api.py), and CSV files use
+the conventions ``flask import`` reads back (genres as one comma separated
+cell).
+
+Progress and throughput go to stderr every chunk.
+"""
+import csv
+import gzip
+import json
+import sys
+import time
+from itertools import islice
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from api import VENUE_FIELDS, ARTIST_FIELDS, SHOW_FIELDS, _default
+from models import db, Venue, Artist, Show
+
+FORMATS = ('csv', 'jsonl', 'jsonl.gz')
+
+# gzip's default of 9 is several times slower for a few percent smaller files.
+GZIP_LEVEL = 6
+
+
+def venues_query():
+    return db.session.query(*VENUE_FIELDS.values()).order_by(Venue.id)
+
+
+def artists_query():
+    return db.session.query(*ARTIST_FIELDS.values()).order_by(Artist.id)
+
+
+def shows_query():
+    return db.session \
+        .query(*SHOW_FIELDS.values()) \
+        .select_from(Show) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .order_by(Show.id)
+
+
+# query, field names, model counted for progress
+KINDS = {
+    'venues': (venues_query, list(VENUE_FIELDS), Venue),
+    'artists': (artists_query, list(ARTIST_FIELDS), Artist),
+    'shows': (shows_query, list(SHOW_FIELDS), Show),
+}
+
+
+class CsvWriter:
+
+    def __init__(self, stream, fields):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(fields)
+
+    def write(self, rows):
+        self.writer.writerows(
+            [','.join(value) if isinstance(value, list) else value for value in row]
+            for row in rows)
+
+
+class JsonlWriter:
+
+    def __init__(self, stream, fields):
+        self.stream = stream
+        self.fields = fields
+
+    def write(self, rows):
+        self.stream.write(''.join(
+            json.dumps(dict(zip(self.fields, row)), default=_default) + '\n' for row in rows))
+
+
+def _open(path, format):
+    if format == 'jsonl.gz':
+        if path == '-':
+            return gzip.open(sys.stdout.buffer, 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8')
+        return gzip.open(path, 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8')
+    if path == '-':
+        return click.open_file(path, 'w')
+    return open(path, 'w', encoding='utf-8', newline='' if format == 'csv' else None)
+
+
+def export(kind, stream, format, chunk_size, progress=None):
+    """Write every row of ``kind`` to ``stream``; return the row count."""
+    query, fields, model = KINDS[kind]
+    writer = (CsvWriter if format == 'csv' else JsonlWriter)(stream, fields)
+    rows = query() \
+        .execution_options(stream_results=True) \
+        .yield_per(chunk_size)
+    rows = iter(rows)
+
+    written = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        writer.write(chunk)
+        written += len(chunk)
+        if progress is not None:
+            progress(written)
+    return written
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('output', default='-')
+@click.option('--format', 'format', type=click.Choice(FORMATS),
+              help='Output format; guessed from the file extension by default.')
+@click.option('--chunk-size', type=click.IntRange(min=1),
+              help='Rows fetched from the cursor at a time (default EXPORT_CHUNK_SIZE).')
+@with_appcontext
+def export_command(kind, output, format, chunk_size):
+    """Dump venues, artists or shows to CSV, JSONL or gzipped JSONL."""
+    if format is None:
+        format = next((format for format in reversed(FORMATS)
+                       if output.endswith('.' + format)), 'jsonl')
+    if chunk_size is None:
+        chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+
+    total = db.session.query(func.count(KINDS[kind][2].id)).scalar()
+    started = time.perf_counter()
+
+    def progress(written):
+        elapsed = time.perf_counter() - started
+        click.echo('\r{}: {}/{} rows ({:.0f} rows/s)'.format(
+            kind, written, total, written / elapsed if elapsed else 0), err=True, nl=False)
+
+    with _open(output, format) as stream:
+        written = export(kind, stream, format, chunk_size, progress)
+    elapsed = time.perf_counter() - started
+
+    click.echo('\r{}: {} rows written in {:.2f}s ({:.0f} rows/s)'.format(
+        kind, written, elapsed, written / elapsed if elapsed else 0), err=True)
+
+
+def init_app(app):
+    app.cli.add_command(export_command)
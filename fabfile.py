@@ -1,3 +1,4 @@
+import os
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
@@ -5,10 +6,13 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # The benchmark suite seeds its own throwaway SQLite catalog; it fails
+    # when a route errors or regresses against the stored baseline.
+    command = "python bench.py --scale 1k 10k --output bench-results.json"
+    if os.path.exists("bench-baseline.json"):
+        command += " --compare bench-baseline.json"
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local(command, capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
@@ -40,7 +44,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python bench.py --scale 1k"
     )
 
 
@@ -1,8 +1,9 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, Regexp, ValidationError
-from enums import State, Genre
+from wtforms.validators import DataRequired, Optional, AnyOf, URL, Regexp, ValidationError
+from enums import State, Genre, PHONE_REGEX, STATES, GENRES
+from models import MAX_AVAILABILITY_LENGTH
 
 
 def ValidateGenres(genres):
@@ -27,6 +28,33 @@ class ShowForm(FlaskForm):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # Optional: without one the show lasts models.DEFAULT_SHOW_DURATION.
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
+
+    def validate_end_time(form, field):
+        if field.data and form.start_time.data and field.data <= form.start_time.data:
+            raise ValidationError('The show must end after it starts.')
+
+class AvailabilityForm(FlaskForm):
+    start_time = DateTimeField(
+        'start_time',
+        validators=[DataRequired()]
+    )
+    end_time = DateTimeField(
+        'end_time',
+        validators=[DataRequired()]
+    )
+
+    def validate_end_time(form, field):
+        if not form.start_time.data:
+            return
+        if field.data <= form.start_time.data:
+            raise ValidationError('The window must end after it starts.')
+        if field.data - form.start_time.data > MAX_AVAILABILITY_LENGTH:
+            raise ValidationError('Windows can be at most {} days long.'.format(MAX_AVAILABILITY_LENGTH.days))
 
 class VenueForm(FlaskForm):
     name = StringField(
@@ -36,20 +64,20 @@ class VenueForm(FlaskForm):
         'city', validators=[DataRequired()]
     )
     state = SelectField(
-        'state', validators=[DataRequired(), AnyOf([item.value for item in State])],
+        'state', validators=[DataRequired(), AnyOf(STATES)],
         choices=State.items()
     )
     address = StringField(
         'address', validators=[DataRequired()]
     )
     phone = StringField(
-        'phone', validators=[Regexp(r'^(\+\d{1,2}\s?)?1?\-?\.?\s?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}$', 0, message='Please insert a valid Phone Number')]
+        'phone', validators=[Regexp(PHONE_REGEX, 0, message='Please insert a valid Phone Number')]
     )
     image_link = StringField(
         'image_link'
     )
     genres = SelectMultipleField(
-        'genres', validators=[DataRequired(), ValidateGenres([item.value for item in Genre])],
+        'genres', validators=[DataRequired(), ValidateGenres(GENRES)],
         choices=Genre.items()
     )
     facebook_link = StringField(
@@ -73,18 +101,18 @@ class ArtistForm(FlaskForm):
         'city', validators=[DataRequired()]
     )
     state = SelectField(
-        'state', validators=[DataRequired(), AnyOf([item.value for item in State])],
+        'state', validators=[DataRequired(), AnyOf(STATES)],
         choices=State.items()
     )
     phone = StringField(
-        'phone', validators=[Regexp(r'^(\+\d{1,2}\s?)?1?\-?\.?\s?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}$', 0, message='Please insert a valid Phone Number')]
+        'phone', validators=[Regexp(PHONE_REGEX, 0, message='Please insert a valid Phone Number')]
     )
 
     image_link = StringField(
         'image_link'
     )
     genres = SelectMultipleField(
-        'genres', validators=[DataRequired(), ValidateGenres([item.value for item in Genre])],
+        'genres', validators=[DataRequired(), ValidateGenres(GENRES)],
         choices=Genre.items()
     )
     facebook_link = StringField(
@@ -0,0 +1,63 @@
+"""``{% cache key, ttl %}``: cache the rendered output of a template block.
+
+    {% for show in shows %}
+        {% cache ('show', show.id, show.stamp) %}
+            ... one tile ...
+        {% endcache %}
+    {% endfor %}
+
+The output is kept in a bounded in-process store (``FRAGMENT_CACHE_SIZE``
+entries, least recently used evicted first) for ``ttl`` seconds, by default
+``FRAGMENT_CACHE_TTL``. Entries are keyed on the template, the tag's line
+and ``key``, which must be hashable (a tuple, not a list).
+
+Keys include the version stamps of the rows a fragment shows
+(``versions.stamps()``), so a change to one of them makes for a new key and
+the old entry ages out. Whatever else the block renders has to be in the key
+too. Bulk loads (``flask import``, bench.py) don't bump per-row stamps; the
+whole cache is dropped when changes.py reports one.
+"""
+from jinja2 import nodes
+from jinja2.ext import Extension
+import changes
+from cache import ViewCache
+
+# No stale period: a fragment can only be rendered by the template using it.
+fragment_cache = ViewCache(stale_ttl=0)
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache_enabled=True)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const('{}:{}'.format(parser.name, lineno)), parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', args), [], [], body).set_lineno(lineno)
+
+    def _cache(self, location, key, ttl, caller):
+        if not self.environment.fragment_cache_enabled:
+            return caller()
+        return fragment_cache.get((location, key), lambda: (caller(), ()), ttl=ttl)
+
+
+@changes.subscribe
+def _drop_bulk_loaded(keys):
+    # Fragments carry no tags, so any bulk load may have changed one.
+    if any(id is None for table, id in keys):
+        fragment_cache.clear()
+
+
+def init_app(app):
+    fragment_cache.maxsize = app.config['FRAGMENT_CACHE_SIZE']
+    fragment_cache.ttl = app.config['FRAGMENT_CACHE_TTL']
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache_enabled = app.config['FRAGMENT_CACHE']
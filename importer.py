@@ -0,0 +1,366 @@
+"""``flask import``: bulk load venues, artists or shows from CSV or JSONL.
+
+    flask import venues partner_venues.csv
+    flask import shows shows.jsonl --batch-size 5000 --rejects rejected.jsonl
+
+Rows are checked against the rules of the forms in forms.py (required fields,
+states, genres, phone and Facebook URL formats) and the valid ones are written
+in batches: multi-row INSERTs, or COPY on Postgres. Shows must
+reference venues and artists that already exist, and may not overlap
+another show of their venue or artist, whether already booked or earlier in
+the file (see bookings.py). Without an end_time they last
+models.DEFAULT_SHOW_DURATION.
+
+Rows that fail validation are skipped and written, with their line number and
+errors, to the rejects file as JSON lines. The command ends with a summary of
+loaded/rejected rows and the throughput in rows per second.
+
+In CSV files genres are a single comma separated cell ("Jazz,Folk") and
+booleans accept y/yes/true/1.
+"""
+import csv
+import io
+import json
+import re
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from wtforms.validators import URL
+import bookings
+import changes
+import versions
+from enums import PHONE_REGEX, STATES, GENRES, TRUE_VALUES
+from models import db, Venue, Artist, Show, DEFAULT_SHOW_DURATION
+
+_phone = re.compile(PHONE_REGEX)
+_url = URL()
+_states = frozenset(STATES)
+_genres = frozenset(GENRES)
+
+
+class Rejected(ValueError):
+    pass
+
+
+def _text(row, name, errors, required=False):
+    value = row.get(name)
+    if value is None:
+        value = ''
+    value = str(value).strip()
+    if required and not value:
+        errors[name] = 'This field is required.'
+    return value or None
+
+
+def _boolean(row, name):
+    value = row.get(name)
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def _state(row, errors):
+    value = _text(row, 'state', errors, required=True)
+    if value is not None and value not in _states:
+        errors['state'] = 'Invalid value, must be one of: {}.'.format(', '.join(STATES))
+    return value
+
+
+def _phone_number(row, errors):
+    value = _text(row, 'phone', errors)
+    if not _phone.match(value or ''):
+        errors['phone'] = 'Please insert a valid Phone Number'
+    return value
+
+
+def _genre_list(row, errors):
+    value = row.get('genres')
+    if isinstance(value, str):
+        value = value.split(',')
+    value = [str(genre).strip() for genre in value or () if str(genre).strip()]
+    if not value:
+        errors['genres'] = 'This field is required.'
+    elif any(genre not in _genres for genre in value):
+        errors['genres'] = 'Genre not valid'
+    return value
+
+
+def _facebook_link(row, errors):
+    value = _text(row, 'facebook_link', errors)
+    match = _url.regex.match(value or '')
+    if not match or not _url.validate_hostname(match.group('host')):
+        errors['facebook_link'] = 'Invalid URL.'
+    return value
+
+
+def _venue(row, context):
+    errors = {}
+    values = {
+        'name': _text(row, 'name', errors, required=True),
+        'city': _text(row, 'city', errors, required=True),
+        'state': _state(row, errors),
+        'address': _text(row, 'address', errors, required=True),
+        'phone': _phone_number(row, errors),
+        'genres': _genre_list(row, errors),
+        'image_link': _text(row, 'image_link', errors),
+        'facebook_link': _facebook_link(row, errors),
+        'website': _text(row, 'website', errors),
+        'seeking_talent': _boolean(row, 'seeking_talent'),
+        'seeking_description': _text(row, 'seeking_description', errors),
+    }
+    if errors:
+        raise Rejected(errors)
+    return values
+
+
+def _artist(row, context):
+    errors = {}
+    values = {
+        'name': _text(row, 'name', errors, required=True),
+        'city': _text(row, 'city', errors, required=True),
+        'state': _state(row, errors),
+        'phone': _phone_number(row, errors),
+        'genres': _genre_list(row, errors),
+        'image_link': _text(row, 'image_link', errors),
+        'website_link': _text(row, 'website_link', errors),
+        'facebook_link': _facebook_link(row, errors),
+        'seeking_venue': _boolean(row, 'seeking_venue'),
+        'seeking_description': _text(row, 'seeking_description', errors),
+    }
+    if errors:
+        raise Rejected(errors)
+    return values
+
+
+def _reference(row, name, existing, errors):
+    value = _text(row, name, errors, required=True)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        errors[name] = 'Not a valid integer value.'
+        return None
+    if value not in existing:
+        errors[name] = 'No such id.'
+    return value
+
+
+def _datetime(row, name, errors, required=False):
+    value = _text(row, name, errors, required=required)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        errors[name] = 'Not a valid datetime value.'
+        return None
+
+
+def _show(row, context):
+    errors = {}
+    values = {
+        'venue_id': _reference(row, 'venue_id', context['venues'], errors),
+        'artist_id': _reference(row, 'artist_id', context['artists'], errors),
+        'start_time': _datetime(row, 'start_time', errors, required=True),
+        'end_time': _datetime(row, 'end_time', errors),
+    }
+    if values['start_time'] is not None:
+        if values['end_time'] is None and 'end_time' not in errors:
+            values['end_time'] = values['start_time'] + DEFAULT_SHOW_DURATION
+        elif values['end_time'] is not None and values['end_time'] <= values['start_time']:
+            errors['end_time'] = 'The show must end after it starts.'
+    if errors:
+        raise Rejected(errors)
+    return values
+
+
+def _show_context():
+    return {
+        'venues': {id for id, in db.session.query(Venue.id)},
+        'artists': {id for id, in db.session.query(Artist.id)},
+        'calendar': bookings.Calendar(),
+    }
+
+
+def _check_bookings(batch, context):
+    """Yield the errors of each ``(line, row, values)`` of a batch (None if it fits)."""
+    calendar = context['calendar']
+    # The timelines of the batch's venues and artists, one query per table.
+    calendar.load({key for line, row, values in batch for key in bookings.booking_keys(values)})
+    for line, row, values in batch:
+        conflict = calendar.conflict(values)
+        if conflict is None:
+            calendar.add(values)
+            yield None
+        else:
+            table, id, show_id = conflict
+            field = 'venue_id' if table == 'venues' else 'artist_id'
+            yield {field: 'Already booked at that time ({}).'.format(
+                'show {}'.format(show_id) if show_id else 'earlier in the file')}
+
+
+# model, row validator, lookups the validator needs, check of a whole batch,
+# tables a load touches
+KINDS = {
+    'venues': (Venue, _venue, dict, None, ('venues',)),
+    'artists': (Artist, _artist, dict, None, ('artists',)),
+    'shows': (Show, _show, _show_context, _check_bookings, ('shows', 'venues', 'artists')),
+}
+
+
+def read_rows(stream, format):
+    """Yield ``(line, row)`` pairs from a CSV or JSONL stream."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(stream, 1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError as e:
+                    yield line, e
+
+
+def _copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        return '{' + ','.join(
+            '"{}"'.format(item.replace('\\', '\\\\').replace('"', '\\"')) for item in value) + '}'
+    return value
+
+
+def _copy(table, columns, batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in batch:
+        writer.writerow([_copy_value(values[column]) for column in columns])
+    buffer.seek(0)
+    connection = db.session.connection().connection
+    with connection.cursor() as cursor:
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            table.name, ', '.join(columns)), buffer)
+
+
+def _insert(table, columns, batch):
+    # An executemany of one cached INSERT: psycopg2 sends it as multi-row
+    # VALUES pages (SQLAlchemy's execute_values mode), SQLite loops in C.
+    # Rendering the batch into a single .values() statement instead costs
+    # far more to compile than it saves.
+    db.session.execute(table.insert(), batch)
+
+
+def _batch_keys(table, batch):
+    # New rows only bump their table's stamp, rows they reference their own.
+    keys = {(table.name, None)}
+    for fk in table.foreign_keys:
+        keys.update((fk.column.table.name, values[fk.parent.name]) for values in batch)
+    return keys
+
+
+def load(kind, rows, batch_size, on_reject=None, use_copy=None):
+    """Validate and insert ``(line, row)`` pairs; return (loaded, rejected)."""
+    model, validate, context, check, tables = KINDS[kind]
+    context = context()
+    table = model.__table__
+    columns = [column.name for column in table.columns if not column.primary_key]
+    if use_copy is None:
+        use_copy = db.engine.dialect.name == 'postgresql'
+    write = _copy if use_copy else _insert
+
+    loaded = rejected = 0
+    pending = []
+
+    def reject(line, row, errors):
+        nonlocal rejected
+        rejected += 1
+        if on_reject is not None:
+            on_reject(line, row, errors)
+
+    def flush():
+        nonlocal loaded
+        batch = [values for line, row, values in pending]
+        if check is not None:
+            batch = []
+            for (line, row, values), errors in zip(pending, check(pending, context)):
+                if errors is None:
+                    batch.append(values)
+                else:
+                    reject(line, row, errors)
+        pending.clear()
+        if batch:
+            write(table, columns, batch)
+            versions.bump(db.session.connection(), _batch_keys(table, batch))
+            db.session.commit()
+            loaded += len(batch)
+
+    try:
+        for line, row in rows:
+            try:
+                if not isinstance(row, dict):
+                    raise Rejected({'row': str(row) if isinstance(row, Exception) else 'Not an object.'})
+                values = validate(row, context)
+            except Rejected as e:
+                reject(line, row, e.args[0])
+                continue
+            pending.append((line, row, dict({column: None for column in columns}, **values)))
+            if len(pending) >= batch_size:
+                flush()
+        if pending:
+            flush()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        # Bulk writes bypass the ORM, so changes.py has nothing to collect.
+        if loaded:
+            changes.publish((name, None) for name in tables)
+    return loaded, rejected
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', type=click.IntRange(min=1),
+              help='Rows per INSERT/COPY and transaction (default IMPORT_BATCH_SIZE).')
+@click.option('--rejects', type=click.File('w', encoding='utf-8'),
+              help='Write rejected rows and their errors here as JSON lines.')
+@click.option('--copy/--no-copy', 'use_copy', default=None,
+              help='Load with COPY (default on Postgres).')
+@with_appcontext
+def import_command(kind, source, format, batch_size, rejects, use_copy):
+    """Bulk load venues, artists or shows from a CSV or JSONL file."""
+    if format is None:
+        format = 'jsonl' if source.name.endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+    if batch_size is None:
+        batch_size = current_app.config['IMPORT_BATCH_SIZE']
+
+    def on_reject(line, row, errors):
+        if rejects is not None:
+            rejects.write(json.dumps({
+                'line': line,
+                'errors': errors,
+                'row': row if isinstance(row, dict) else None,
+            }, default=str) + '\n')
+
+    started = time.perf_counter()
+    loaded, rejected = load(kind, read_rows(source, format), batch_size, on_reject, use_copy)
+    elapsed = time.perf_counter() - started
+
+    click.echo('{}: {} loaded, {} rejected in {:.2f}s ({:.0f} rows/s)'.format(
+        kind, loaded, rejected, elapsed, (loaded + rejected) / elapsed if elapsed else 0))
+    if rejected and rejects is None:
+        click.echo('Pass --rejects FILE to see why rows were rejected.', err=True)
+
+
+def init_app(app):
+    app.cli.add_command(import_command)
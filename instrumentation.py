@@ -0,0 +1,142 @@
+"""Opt-in per-request timing (``INSTRUMENTATION = True``).
+
+For every request it records the number of SQL statements and the time
+spent running them, the relationships lazy loaded through the ORM, the time
+spent rendering Jinja templates (not counting SQL issued while rendering),
+the wait for a pooled connection and the remaining Python time. These are
+sent back as a ``Server-Timing`` header, which browser dev tools show next
+to the request, and logged as one JSON line per request:
+
+    {"method": "GET", "path": "/venues", "endpoint": "venues", "status": 200,
+     "statements": 2, "sql_ms": 3.1, "lazy_loads": 0, "pool_wait_ms": 0.0,
+     "jinja_ms": 8.4, "python_ms": 1.2, "total_ms": 12.7}
+
+A request that runs more statements than its budget (``QUERY_BUDGET``, or
+the endpoint's entry in ``QUERY_BUDGETS``) is logged as a warning with
+``"over_budget": true``, which is how N+1 patterns get noticed.
+
+Timings stop when the view returns; a streamed body is not included.
+"""
+import json
+import time
+from flask import g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+class Timings:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql = 0.0
+        self.lazy_loads = 0
+        self.jinja = 0.0
+        self.rendering = 0
+        # Time spent waiting for a pooled connection (see pooling.py).
+        self.pool_wait = 0.0
+
+
+def _timings():
+    if has_request_context():
+        return g.get('timings')
+
+
+class TimedTemplate(Template):
+
+    def render(self, *args, **kwargs):
+        timings = _timings()
+        if timings is None:
+            return super().render(*args, **kwargs)
+        timings.rendering += 1
+        started, sql = time.perf_counter(), timings.sql
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            timings.rendering -= 1
+            if not timings.rendering:
+                timings.jinja += time.perf_counter() - started - (timings.sql - sql)
+
+
+# The start time goes on the statement's execution context, not the
+# connection: a statement that raises never reaches after_cursor_execute and
+# would leave its start behind for the next one to be paired with.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _timings() is not None and context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _timings()
+    started = getattr(context, '_query_started', None)
+    if timings is not None and started is not None:
+        timings.statements += 1
+        timings.sql += time.perf_counter() - started
+
+
+def _do_orm_execute(orm_execute_state):
+    timings = _timings()
+    if timings is not None and orm_execute_state.is_select \
+            and orm_execute_state.lazy_loaded_from is not None:
+        timings.lazy_loads += 1
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def init_app(app):
+    if not app.config['INSTRUMENTATION']:
+        return
+
+    app.jinja_env.template_class = TimedTemplate
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+
+    @app.before_request
+    def start_timings():
+        g.timings = Timings()
+
+    @app.after_request
+    def report_timings(response):
+        timings = g.pop('timings', None)
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.started
+        python = max(total - timings.sql - timings.jinja - timings.pool_wait, 0.0)
+
+        budget = app.config['QUERY_BUDGETS'].get(request.endpoint, app.config['QUERY_BUDGET'])
+        over_budget = budget is not None and timings.statements > budget
+
+        response.headers.add('Server-Timing', ', '.join([
+            'sql;dur={};desc="{} statements"'.format(_ms(timings.sql), timings.statements),
+            'lazy;desc="{} lazy loads"'.format(timings.lazy_loads),
+            'pool;dur={}'.format(_ms(timings.pool_wait)),
+            'jinja;dur={}'.format(_ms(timings.jinja)),
+            'python;dur={}'.format(_ms(python)),
+            'total;dur={}'.format(_ms(total)),
+        ]))
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'statements': timings.statements,
+            'sql_ms': _ms(timings.sql),
+            'lazy_loads': timings.lazy_loads,
+            'pool_wait_ms': _ms(timings.pool_wait),
+            'jinja_ms': _ms(timings.jinja),
+            'python_ms': _ms(python),
+            'total_ms': _ms(total),
+        }
+        if over_budget:
+            record['over_budget'] = True
+            record['query_budget'] = budget
+            app.logger.warning(json.dumps(record))
+        else:
+            app.logger.info(json.dumps(record))
+        return response
@@ -0,0 +1,24 @@
+"""btree index for the artists listing
+
+Revision ID: 0a7d3e91c5b8
+Revises: f5c81d3e6a29
+Create Date: 2026-10-18 21:07:33.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a7d3e91c5b8'
+down_revision = 'f5c81d3e6a29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_artists_name_id', 'artists', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artists_name_id', table_name='artists')
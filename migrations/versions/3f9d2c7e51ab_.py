@@ -0,0 +1,50 @@
+"""search indexes for venues and artists
+
+Revision ID: 3f9d2c7e51ab
+Revises: 22861ae0d420
+Create Date: 2026-10-18 10:12:41.208113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9d2c7e51ab'
+down_revision = '22861ae0d420'
+branch_labels = None
+depends_on = None
+
+# array_to_string() is only STABLE, so the document is built by an IMMUTABLE
+# wrapper that both the index expression and search.py call.
+SEARCH_DOCUMENT = """
+CREATE OR REPLACE FUNCTION fyyur_search_document(name text, city text, state text, genres text[])
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT to_tsvector('simple'::regconfig,
+        coalesce(name, '') || ' ' ||
+        coalesce(city, '') || ' ' ||
+        coalesce(state, '') || ' ' ||
+        coalesce(array_to_string(genres, ' '), ''))
+$$
+"""
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute(SEARCH_DOCUMENT)
+    for table in ('venues', 'artists'):
+        op.create_index('ix_{}_name_trgm'.format(table), table, ['name'],
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_{}_search_document'.format(table), table,
+                        [sa.text('fyyur_search_document(name, city, state, genres)')],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index('ix_{}_search_document'.format(table), table_name=table)
+        op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
+    op.execute('DROP FUNCTION IF EXISTS fyyur_search_document(text, text, text, text[])')
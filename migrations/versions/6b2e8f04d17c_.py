@@ -0,0 +1,26 @@
+"""gin indexes for genre filters
+
+Revision ID: 6b2e8f04d17c
+Revises: 0a7d3e91c5b8
+Create Date: 2026-10-18 23:12:05.734920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2e8f04d17c'
+down_revision = '0a7d3e91c5b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE INDEX ix_venues_genres ON venues USING gin (genres)')
+    op.execute('CREATE INDEX ix_artists_genres ON artists USING gin (genres)')
+
+
+def downgrade():
+    op.drop_index('ix_artists_genres', table_name='artists')
+    op.drop_index('ix_venues_genres', table_name='venues')
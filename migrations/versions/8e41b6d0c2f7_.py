@@ -0,0 +1,28 @@
+"""indexes on shows for venue, artist and date lookups
+
+Revision ID: 8e41b6d0c2f7
+Revises: 3f9d2c7e51ab
+Create Date: 2026-10-18 11:40:03.517264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e41b6d0c2f7'
+down_revision = '3f9d2c7e51ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'])
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'])
+    op.create_index('ix_shows_start_time', 'shows', ['start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time', table_name='shows')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
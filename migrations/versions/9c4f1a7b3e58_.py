@@ -0,0 +1,36 @@
+"""venue and artist names and places not null
+
+Revision ID: 9c4f1a7b3e58
+Revises: 6b2e8f04d17c
+Create Date: 2026-10-19 00:41:17.506382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4f1a7b3e58'
+down_revision = '6b2e8f04d17c'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    ('name', sa.String()),
+    ('city', sa.String(length=120)),
+    ('state', sa.String(length=120)),
+]
+
+
+def upgrade():
+    # Rows with a NULL key were skipped by keyset pagination; list them as ''.
+    for table in ('venues', 'artists'):
+        for column, type_ in COLUMNS:
+            op.execute("UPDATE {0} SET {1} = '' WHERE {1} IS NULL".format(table, column))
+            op.alter_column(table, column, existing_type=type_, nullable=False)
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        for column, type_ in COLUMNS:
+            op.alter_column(table, column, existing_type=type_, nullable=True)
@@ -0,0 +1,30 @@
+"""version stamps for conditional GET
+
+Revision ID: c41f7a9e2d36
+Revises: 8e41b6d0c2f7
+Create Date: 2026-10-18 13:05:27.914402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f7a9e2d36'
+down_revision = '8e41b6d0c2f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('versions',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('entity_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name', 'entity_id')
+    )
+
+
+def downgrade():
+    op.drop_table('versions')
@@ -0,0 +1,42 @@
+"""show end times and no overlapping bookings
+
+Revision ID: d9a3b1c4e7f2
+Revises: c41f7a9e2d36
+Create Date: 2026-10-18 15:42:08.316205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a3b1c4e7f2'
+down_revision = 'c41f7a9e2d36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # Existing shows get the default duration (models.DEFAULT_SHOW_DURATION).
+    op.execute("UPDATE shows SET end_time = start_time + interval '2 hours'")
+    op.alter_column('shows', 'end_time', nullable=False)
+    op.create_check_constraint('ck_shows_end_after_start', 'shows', 'end_time > start_time')
+
+    # Fails if a venue or an artist already has overlapping shows; list them
+    # with
+    #   SELECT a.id, b.id FROM shows a JOIN shows b ON a.venue_id = b.venue_id
+    #    AND a.id < b.id AND tsrange(a.start_time, a.end_time) && tsrange(b.start_time, b.end_time);
+    # (and the same on artist_id) and move or remove them first.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('ALTER TABLE shows ADD CONSTRAINT ex_shows_venue_overlap EXCLUDE USING gist '
+               '(venue_id WITH =, tsrange(start_time, end_time) WITH &&)')
+    op.execute('ALTER TABLE shows ADD CONSTRAINT ex_shows_artist_overlap EXCLUDE USING gist '
+               '(artist_id WITH =, tsrange(start_time, end_time) WITH &&)')
+
+
+def downgrade():
+    op.drop_constraint('ex_shows_artist_overlap', 'shows')
+    op.drop_constraint('ex_shows_venue_overlap', 'shows')
+    op.drop_constraint('ck_shows_end_after_start', 'shows', type_='check')
+    op.drop_column('shows', 'end_time')
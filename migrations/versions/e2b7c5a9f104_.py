@@ -0,0 +1,39 @@
+"""artist availability windows
+
+Revision ID: e2b7c5a9f104
+Revises: d9a3b1c4e7f2
+Create Date: 2026-10-18 17:10:44.602918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7c5a9f104'
+down_revision = 'd9a3b1c4e7f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('availabilities',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.CheckConstraint('end_time > start_time', name='ck_availabilities_end_after_start'),
+    sa.CheckConstraint("end_time - start_time <= interval '90 days'", name='ck_availabilities_max_length'),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_availabilities_artist_id_start_time', 'availabilities', ['artist_id', 'start_time', 'end_time'], unique=False)
+    op.create_index('ix_availabilities_start_time', 'availabilities', ['start_time', 'end_time', 'artist_id'], unique=False)
+    op.execute('CREATE INDEX ix_availabilities_period ON availabilities USING gist (tsrange(start_time, end_time))')
+
+
+def downgrade():
+    op.drop_index('ix_availabilities_period', table_name='availabilities')
+    op.drop_index('ix_availabilities_start_time', table_name='availabilities')
+    op.drop_index('ix_availabilities_artist_id_start_time', table_name='availabilities')
+    op.drop_table('availabilities')
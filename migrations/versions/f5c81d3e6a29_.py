@@ -0,0 +1,30 @@
+"""indexes for shows by date range, city and state
+
+Revision ID: f5c81d3e6a29
+Revises: e2b7c5a9f104
+Create Date: 2026-10-18 18:24:51.120733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c81d3e6a29'
+down_revision = 'e2b7c5a9f104'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venues_state_city', 'venues', ['state', 'city', 'name', 'id'], unique=False)
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time', 'end_time', 'artist_id'], unique=False)
+    op.execute('CREATE INDEX ix_shows_start_time_brin ON shows USING brin (start_time) WITH (pages_per_range = 32)')
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time_brin', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.drop_index('ix_venues_state_city', table_name='venues')
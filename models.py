@@ -1,24 +1,69 @@
-from flask_sqlalchemy import SQLAlchemy
+from datetime import timedelta
+import flask_sqlalchemy
+from sqlalchemy import DDL, event, orm
+from pooling import engine_options, track
+from replicas import RoutingSession
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+
+    def create_session(self, options):
+        # Sessions pick a replica or the primary per statement.
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        return track(super().create_engine(sa_url, engine_options(sa_url, engine_opts)))
+
 
 db = SQLAlchemy()
 
+# Postgres stores genres natively; the JSON variant lets the same models run
+# against a local SQLite file (benchmarks, scratch databases).
+Genres = db.ARRAY(db.String).with_variant(db.JSON, 'sqlite')
+
+# What the search indexes below (and search.py) need on Postgres, created
+# before the tables by create_all() as migration 3f9d2c7e51ab does. The
+# document function is an IMMUTABLE wrapper because array_to_string() is
+# only STABLE and can't be indexed.
+SEARCH_DOCUMENT = """
+CREATE OR REPLACE FUNCTION fyyur_search_document(name text, city text, state text, genres text[])
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT to_tsvector('simple'::regconfig,
+        coalesce(name, '') || ' ' ||
+        coalesce(city, '') || ' ' ||
+        coalesce(state, '') || ' ' ||
+        coalesce(array_to_string(genres, ' '), ''))
+$$
+"""
+for _ddl in ('CREATE EXTENSION IF NOT EXISTS pg_trgm', SEARCH_DOCUMENT):
+    event.listen(db.Model.metadata, 'before_create', DDL(_ddl).execute_if(dialect='postgresql'))
+
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # Covers finding a city's venues (and listing them by area).
+        db.Index('ix_venues_state_city', 'state', 'city', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    # NOT NULL: the listings page on them (see pagination.keyset_paginate()).
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String), nullable=False)
+    genres = db.Column(Genres, nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
 
-    shows = db.relationship('Show', backref='venue', lazy='joined', cascade='all, delete')
+    shows = db.relationship('Show', back_populates='venue', cascade='all, delete')
 
     def to_dict(self):
         return {
@@ -41,21 +86,29 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # Serves the /artists listing's ORDER BY name, id, which GIN can't.
+        db.Index('ix_artists_name_id', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    # NOT NULL: the listings page on them (see pagination.keyset_paginate()).
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String), nullable=False)
+    genres = db.Column(Genres, nullable=False)
     image_link = db.Column(db.String(500))
     website_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
 
-    shows = db.relationship('Show', backref='artist', lazy='joined', cascade='all, delete')
-    
+    shows = db.relationship('Show', back_populates='artist', cascade='all, delete')
+    availabilities = db.relationship('Availability', back_populates='artist', cascade='all, delete')
+
 
     def to_dict(self):
         return {
@@ -75,13 +128,42 @@ class Artist(db.Model):
     def __repr__(self):
         return f'<Artist {self.id} {self.name}>'
 
+for _model in (Venue, Artist):
+    event.listen(_model.__table__, 'after_create', DDL(
+        'CREATE INDEX ix_%(table)s_search_document ON %(table)s '
+        'USING gin (fyyur_search_document(name, city, state, genres))').execute_if(dialect='postgresql'))
+    # Genre filters (queries.genre_filter()).
+    event.listen(_model.__table__, 'after_create', DDL(
+        'CREATE INDEX ix_%(table)s_genres ON %(table)s USING gin (genres)').execute_if(dialect='postgresql'))
+
+# How long a show listed without an end time lasts.
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+
+
+def _default_end_time(context):
+    return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
+
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        # Covers a venue's shows in a date range, without visiting the rows.
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time', 'end_time', 'artist_id'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time', 'start_time'),
+        db.CheckConstraint('end_time > start_time', name='ck_shows_end_after_start'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    # Shows occupy [start_time, end_time): one ending at eight and the next
+    # starting at eight do not overlap.
+    end_time = db.Column(db.DateTime, nullable=False, default=_default_end_time)
+
+    venue = db.relationship('Venue', back_populates='shows')
+    artist = db.relationship('Artist', back_populates='shows')
 
     def show_artist(self):
         return {
@@ -98,3 +180,79 @@ class Show(db.Model):
             'venue_image_link': self.venue.image_link,
             'start_time': self.start_time.strftime('%Y-%m-%d %H:%M:%S')
         }
+
+# A venue or an artist can't have two shows at once. Postgres enforces it
+# with exclusion constraints (GiST, through btree_gist for the integer ids);
+# other databases rely on the check in bookings.py. The migration adds the
+# same constraints to existing databases.
+for _ddl in (
+        'CREATE EXTENSION IF NOT EXISTS btree_gist',
+        'ALTER TABLE shows ADD CONSTRAINT ex_shows_venue_overlap EXCLUDE USING gist '
+        '(venue_id WITH =, tsrange(start_time, end_time) WITH &&)',
+        'ALTER TABLE shows ADD CONSTRAINT ex_shows_artist_overlap EXCLUDE USING gist '
+        '(artist_id WITH =, tsrange(start_time, end_time) WITH &&)'):
+    event.listen(Show.__table__, 'after_create', DDL(_ddl).execute_if(dialect='postgresql'))
+
+# Shows are booked weeks rather than years ahead, so rows land on disk in
+# roughly start time order and on Postgres a BRIN index (a few pages for the
+# whole table) narrows date range scans down to the blocks holding them. The
+# btree on start_time stays for ordering.
+event.listen(Show.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_shows_start_time_brin ON shows '
+    'USING brin (start_time) WITH (pages_per_range = 32)').execute_if(dialect='postgresql'))
+
+# Longest availability window an artist can publish. Queries rely on it to
+# bound their scans of the start_time indexes (see queries.available_between()).
+MAX_AVAILABILITY_LENGTH = timedelta(days=90)
+
+
+class Availability(db.Model):
+    """A window, ``[start_time, end_time)``, in which an artist can be booked."""
+    __tablename__ = 'availabilities'
+    __table_args__ = (
+        db.Index('ix_availabilities_artist_id_start_time', 'artist_id', 'start_time', 'end_time'),
+        db.Index('ix_availabilities_start_time', 'start_time', 'end_time', 'artist_id'),
+        db.CheckConstraint('end_time > start_time', name='ck_availabilities_end_after_start'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+
+    artist = db.relationship('Artist', back_populates='availabilities')
+
+# Enforced by the database too, since writes that bypass AvailabilityForm
+# (imports, scripts) would otherwise store windows the queries never find.
+# SQLite can't add a constraint to an existing table, so triggers check it
+# there, to the millisecond.
+event.listen(Availability.__table__, 'after_create', DDL(
+    'ALTER TABLE availabilities ADD CONSTRAINT ck_availabilities_max_length '
+    "CHECK (end_time - start_time <= interval '%d days')" % MAX_AVAILABILITY_LENGTH.days
+).execute_if(dialect='postgresql'))
+for _event in ('INSERT', 'UPDATE'):
+    event.listen(Availability.__table__, 'after_create', DDL(
+        'CREATE TRIGGER ck_availabilities_max_length_%s BEFORE %s ON availabilities '
+        'WHEN round((julianday(NEW.end_time) - julianday(NEW.start_time)) * 86400000) > %d '
+        "BEGIN SELECT RAISE(ABORT, 'CHECK constraint failed: ck_availabilities_max_length'); END"
+        % (_event.lower(), _event, MAX_AVAILABILITY_LENGTH.total_seconds() * 1000)
+    ).execute_if(dialect='sqlite'))
+
+# Postgres answers "which windows overlap this range" from a GiST index over
+# the ranges; elsewhere the start_time index, bounded by
+# MAX_AVAILABILITY_LENGTH, does.
+event.listen(Availability.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_availabilities_period ON availabilities '
+    'USING gist (tsrange(start_time, end_time))').execute_if(dialect='postgresql'))
+
+class Version(db.Model):
+    """Change stamp of a table (entity_id 0) or of one of its rows.
+
+    Bumped in the same transaction as the change itself (see versions.py).
+    """
+    __tablename__ = 'versions'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
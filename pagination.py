@@ -0,0 +1,84 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+from flask import request, url_for
+from sqlalchemy import DateTime, tuple_
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(values):
+    payload = json.dumps([
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """Return the key values stored in ``cursor``, or None if it is not one
+    of ours (tampered, truncated or for a different ordering)."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            return None
+        return [
+            datetime.fromisoformat(value) if isinstance(key.type, DateTime) else value
+            for key, value in zip(keys, values)
+        ]
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(query, keys, key_of, per_page, after=None, before=None, descending=False):
+    """Fetch one page of ``query`` ordered by ``keys`` (unique together).
+
+    Instead of OFFSET, the page starts right after (or ends right before) the
+    key values encoded in the cursor, so the database seeks straight to it
+    with an index and every page costs the same no matter how deep it is.
+    ``key_of`` extracts the key values from a result row. The keys must be
+    NOT NULL columns: a row comparison with a NULL in it is never true, so
+    such rows would never be reached.
+    """
+    after = decode_cursor(after, keys) if after else None
+    before = decode_cursor(before, keys) if before else None
+    key = tuple_(*keys)
+    backwards = before is not None and after is None
+
+    if backwards:
+        query = query.filter(key > tuple_(*before) if descending else key < tuple_(*before))
+        ordering = [k.asc() if descending else k.desc() for k in keys]
+    else:
+        if after is not None:
+            query = query.filter(key < tuple_(*after) if descending else key > tuple_(*after))
+        ordering = [k.desc() if descending else k.asc() for k in keys]
+
+    rows = query.order_by(*ordering).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+
+    if backwards:
+        items.reverse()
+        next_cursor = encode_cursor(key_of(items[-1])) if items else None
+        prev_cursor = encode_cursor(key_of(items[0])) if items and has_more else None
+    else:
+        next_cursor = encode_cursor(key_of(items[-1])) if items and has_more else None
+        prev_cursor = encode_cursor(key_of(items[0])) if items and after is not None else None
+
+    return Page(items, next_cursor, prev_cursor)
+
+
+def page_url(after=None, before=None):
+    """URL of the current listing with its cursor replaced, keeping any other
+    query string arguments (filters) intact."""
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    if after:
+        args['after'] = after
+    if before:
+        args['before'] = before
+    return url_for(request.endpoint, **request.view_args, **args)
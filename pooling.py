@@ -0,0 +1,218 @@
+"""Connection pool settings, pool instrumentation and statement timeouts.
+
+The pool is configured from the environment (see config.py):
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW   connections kept open / allowed on top
+    DB_POOL_TIMEOUT                 seconds to wait for a free connection
+    DB_POOL_RECYCLE                 seconds before a connection is replaced
+    DB_POOL_PRE_PING                1 to test connections on checkout
+
+Checkouts that find every connection (overflow included) in use are counted
+as exhausted, and the time spent waiting for one is recorded. ``stats()``
+reports both per engine, ``/metrics/pool`` serves them, and with
+instrumentation.py enabled each request's wait shows up in Server-Timing.
+Size the pool so ``waits`` stays near zero at the worker count in use.
+
+Every request's statements get a timeout: ``STATEMENT_TIMEOUT``
+milliseconds, or the endpoint's entry in ``STATEMENT_TIMEOUTS`` (both also
+read from the environment). Postgres enforces it with ``SET LOCAL
+statement_timeout``; on SQLite a progress handler interrupts a statement
+running for longer than the timeout. Postgres times each FETCH of a
+server-side cursor on its own, so streamed responses call
+``restart_timeouts()`` between the chunks the client reads to get the same
+on SQLite. Work that outlives the request, like loading the search index,
+runs inside ``unlimited()``.
+Commands run outside requests (flask import/export) are not limited.
+
+Engines survive a fork (a server preloading the app before starting its
+workers): the child gets fresh pools, leaving the parent's connections to
+the parent.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Options only a QueuePool accepts; SQLite files use a NullPool.
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+# SQLite calls the progress handler every this many VM instructions.
+SQLITE_PROGRESS_STEPS = 10000
+
+
+class InstrumentedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+        }
+
+    def _do_get(self):
+        exhausted = self._max_overflow > -1 \
+            and self.checkedout() >= self.size() + self._max_overflow
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self.lock:
+                self.counters['timeouts'] += 1
+            logger.warning('Connection pool exhausted: timed out after %.1fs (size %d, overflow %d)',
+                           self._timeout, self.size(), self._max_overflow)
+            raise
+        finally:
+            waited = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.counters['checkouts'] += 1
+                if exhausted:
+                    self.counters['waits'] += 1
+                    self.counters['wait_ms'] += waited
+                    self.counters['max_wait_ms'] = max(self.counters['max_wait_ms'], waited)
+            if has_request_context():
+                timings = g.get('timings')
+                if timings is not None:
+                    timings.pool_wait += waited / 1000
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters,
+                        size=self.size(),
+                        max_overflow=self._max_overflow,
+                        checked_out=self.checkedout(),
+                        overflow=self.overflow())
+
+
+_engines = weakref.WeakSet()
+
+
+def track(engine):
+    """Give ``engine`` a new pool in processes forked after this."""
+    _engines.add(engine)
+    return engine
+
+
+def _after_fork():
+    for engine in list(_engines):
+        # What Engine.dispose() does, except that closing the inherited
+        # connections would also close them for the parent.
+        engine.pool = engine.pool.recreate()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def engine_options(sa_url, options):
+    """Adapt the configured engine options to the database in ``sa_url``."""
+    options = dict(options)
+    if sa_url.get_backend_name() == 'sqlite':
+        for name in QUEUE_POOL_OPTIONS:
+            options.pop(name, None)
+    elif 'poolclass' not in options:
+        options['poolclass'] = InstrumentedQueuePool
+    return options
+
+
+def stats(engines):
+    """Pool statistics of the named ``engines``, where they are collected."""
+    return {name: engine.pool.stats() for name, engine in engines.items()
+            if isinstance(engine.pool, InstrumentedQueuePool)}
+
+
+def _statement_timeout():
+    if not has_request_context():
+        return None
+    config = current_app.config
+    return config['STATEMENT_TIMEOUTS'].get(request.endpoint, config['STATEMENT_TIMEOUT']) or None
+
+
+def _interrupt(info):
+    def handler():
+        # A non-zero return aborts the running statement.
+        deadline = info.get('deadline')
+        return deadline is not None and time.monotonic() > deadline
+    return handler
+
+
+@event.listens_for(Session, 'after_begin')
+def _set_statement_timeout(session, transaction, connection):
+    timeout = _statement_timeout()
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        if timeout:
+            connection.exec_driver_sql('SET LOCAL statement_timeout = {:d}'.format(timeout))
+    elif dialect == 'sqlite':
+        raw = connection.connection.connection
+        info = connection.info
+        if timeout:
+            info['statement_timeout'] = timeout / 1000
+            info['deadline'] = None
+            raw.set_progress_handler(_interrupt(info), SQLITE_PROGRESS_STEPS)
+            g.setdefault('timed_connections', []).append(info)
+        else:
+            info.pop('statement_timeout', None)
+            raw.set_progress_handler(None, 0)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_deadline(conn, cursor, statement, parameters, context, executemany):
+    timeout = conn.info.get('statement_timeout')
+    if timeout is not None:
+        conn.info['deadline'] = time.monotonic() + timeout
+
+
+def restart_timeouts():
+    """Give the statements this request is still reading from a full timeout
+    again (SQLite; Postgres times every FETCH by itself)."""
+    if not has_request_context():
+        return
+    for info in g.get('timed_connections', ()):
+        timeout = info.get('statement_timeout')
+        if timeout is not None:
+            info['deadline'] = time.monotonic() + timeout
+
+
+@contextmanager
+def unlimited(connection):
+    """Run the statements of the block on ``connection`` without a timeout."""
+    timeout = _statement_timeout()
+    if not timeout:
+        yield
+        return
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL statement_timeout = 0')
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql('SET LOCAL statement_timeout = {:d}'.format(timeout))
+        return
+    info = connection.info
+    saved = info.pop('statement_timeout', None)
+    info['deadline'] = None
+    try:
+        yield
+    finally:
+        if saved is not None:
+            info['statement_timeout'] = saved
+
+
+@event.listens_for(Pool, 'checkin')
+def _clear_progress_handler(dbapi_connection, connection_record):
+    connection_record.info.pop('statement_timeout', None)
+    connection_record.info.pop('deadline', None)
+    if dbapi_connection is not None and hasattr(dbapi_connection, 'set_progress_handler'):
+        dbapi_connection.set_progress_handler(None, 0)
@@ -0,0 +1,59 @@
+"""Named relationship loading profiles.
+
+Relationships in models.py load lazily by default; each view picks the
+profile matching what it renders instead:
+
+- ``list``: columns only, related rows are never loaded.
+- ``detail``: the entity alone for venue/artist pages, whose shows are
+  queried (split and paginated) separately; a show with both of its sides.
+- ``edit``: the entity alone, for the edit forms.
+- ``delete``: the entity with its shows (and an artist's availability),
+  so the delete cascade does not lazy load them.
+
+In debug mode a lazy load that still fires during a request is logged as
+a warning, naming the endpoint and the instance it was loaded for.
+"""
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, noload, selectinload
+from models import Venue, Artist, Show
+
+LOADER_PROFILES = {
+    'list': {
+        Venue: (noload(Venue.shows),),
+        Artist: (noload(Artist.shows), noload(Artist.availabilities)),
+        Show: (noload(Show.venue), noload(Show.artist)),
+    },
+    'detail': {
+        Venue: (noload(Venue.shows),),
+        Artist: (noload(Artist.shows), noload(Artist.availabilities)),
+        Show: (joinedload(Show.venue), joinedload(Show.artist)),
+    },
+    'edit': {
+        Venue: (noload(Venue.shows),),
+        Artist: (noload(Artist.shows), noload(Artist.availabilities)),
+        Show: (noload(Show.venue), noload(Show.artist)),
+    },
+    'delete': {
+        Venue: (selectinload(Venue.shows),),
+        Artist: (selectinload(Artist.shows), selectinload(Artist.availabilities)),
+        Show: (),
+    },
+}
+
+
+def load_profile(model, profile):
+    """``model.query`` with the relationship options of ``profile``."""
+    return model.query.options(*LOADER_PROFILES[profile][model])
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _warn_on_lazy_load(orm_execute_state):
+    if not orm_execute_state.is_select or not has_request_context():
+        return
+    if orm_execute_state.lazy_loaded_from is None:
+        return
+    if current_app.config.get('WARN_ON_LAZY_LOAD', current_app.debug):
+        current_app.logger.warning(
+            'Lazy load for %r in %s %s (endpoint %s); add it to the view\'s loader profile',
+            orm_execute_state.lazy_loaded_from.object, request.method, request.path, request.endpoint)
@@ -0,0 +1,193 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import String, and_, case, cast, func, select
+from sqlalchemy.dialects import postgresql
+from models import db, Venue, Artist, Show, Availability, MAX_AVAILABILITY_LENGTH
+from pagination import Page, keyset_paginate
+
+
+# Evenings start at EVENING, and a night lasts until NIGHT_END the next day.
+EVENING = time(17)
+NIGHT_END = time(4)
+
+
+def listing_day(now):
+    """The day ``now`` belongs to for the named periods: until NIGHT_END it
+    is still the day before."""
+    return (now - timedelta(hours=NIGHT_END.hour, minutes=NIGHT_END.minute)).date()
+
+
+def periods(now=None):
+    """Named show time ranges, ``{name: (start, end)}``, around ``now``.
+
+    ``tonight`` runs from this evening until early tomorrow (until NIGHT_END
+    it is still last night), ``weekend`` from Friday evening until early
+    Monday: the weekend under way, or else the coming one.
+    """
+    day = listing_day(now or datetime.now())
+    friday = day + timedelta(days=4 - day.weekday())
+    return {
+        'tonight': (datetime.combine(day, EVENING), datetime.combine(day + timedelta(days=1), NIGHT_END)),
+        'weekend': (datetime.combine(friday, EVENING), datetime.combine(friday + timedelta(days=3), NIGHT_END)),
+    }
+
+
+def until(value):
+    """Exclusive end of an inclusive ``to`` bound: the day after a date, so
+    the whole day is included, or just past a datetime."""
+    try:
+        return datetime.combine(date.fromisoformat(value), time()) + timedelta(days=1)
+    except ValueError:
+        return datetime.fromisoformat(value) + timedelta(microseconds=1)
+
+
+def venue_areas(per_page, after=None, before=None, now=None):
+    now = now or datetime.now()
+
+    # The page is sought on ix_venues_state_city before anything is counted,
+    # so the counts cover only the page's venues, not the whole table. Rows
+    # come sorted by area and can be grouped in a single pass.
+    page = keyset_paginate(
+        db.session.query(Venue.city, Venue.state, Venue.id, Venue.name),
+        keys=[Venue.state, Venue.city, Venue.name, Venue.id],
+        key_of=lambda row: (row.state, row.city, row.name, row.id),
+        per_page=per_page,
+        after=after,
+        before=before)
+    counts = upcoming_show_counts(Show.venue_id, [row.id for row in page.items], now)
+
+    areas = []
+    for row in page.items:
+        if not areas or (areas[-1]['city'], areas[-1]['state']) != (row.city, row.state):
+            areas.append({
+                'city': row.city,
+                'state': row.state,
+                'venues': []
+            })
+        areas[-1]['venues'].append({
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': counts[row.id]
+        })
+
+    return Page(areas, page.next_cursor, page.prev_cursor)
+
+
+def upcoming_show_counts(column, ids, now=None):
+    """Map each id in ``ids`` to its number of upcoming shows.
+
+    ``column`` is the Show foreign key to group on (``Show.venue_id`` or
+    ``Show.artist_id``). Ids without upcoming shows map to 0. Always a single
+    GROUP BY statement, however many ids are passed.
+    """
+    ids = list(ids)
+    if not ids:
+        return {}
+    now = now or datetime.now()
+
+    rows = db.session \
+        .query(column, func.count(Show.id)) \
+        .filter(column.in_(ids)) \
+        .filter(Show.start_time > now) \
+        .group_by(column) \
+        .all()
+
+    counts = dict.fromkeys(ids, 0)
+    counts.update(rows)
+    return counts
+
+
+def show_counts(column, id, now=None):
+    """``(upcoming, past)`` show counts for the venue or artist whose
+    ``column`` (``Show.venue_id`` or ``Show.artist_id``) equals ``id``, from
+    one aggregate."""
+    now = now or datetime.now()
+
+    return db.session \
+        .query(
+            func.count(case((Show.start_time > now, 1))),
+            func.count(case((Show.start_time <= now, 1)))) \
+        .filter(column == id) \
+        .one()
+
+
+def _shows_with(other):
+    # Shows joined to the other side of the relationship, labelled the way
+    # the detail templates expect (artist_id, artist_name, ...).
+    prefix = other.__name__.lower()
+    foreign_key = Show.artist_id if other is Artist else Show.venue_id
+
+    return db.session \
+        .query(
+            Show.id,
+            Show.start_time,
+            other.id.label(prefix + '_id'),
+            other.name.label(prefix + '_name'),
+            other.image_link.label(prefix + '_image_link')) \
+        .join(other, foreign_key == other.id)
+
+
+def upcoming_shows(column, id, other, limit, now=None):
+    """The next ``limit`` shows of a venue or artist, soonest first."""
+    now = now or datetime.now()
+
+    return _shows_with(other) \
+        .filter(column == id) \
+        .filter(Show.start_time > now) \
+        .order_by(Show.start_time, Show.id) \
+        .limit(limit) \
+        .all()
+
+
+def past_shows(column, id, other, per_page, after=None, now=None):
+    """One page of a venue's or artist's past shows, newest first."""
+    now = now or datetime.now()
+
+    return keyset_paginate(
+        _shows_with(other).filter(column == id).filter(Show.start_time <= now),
+        keys=[Show.start_time, Show.id],
+        key_of=lambda show: (show.start_time, show.id),
+        per_page=per_page,
+        after=after,
+        descending=True)
+
+
+def genre_filter(column, genre):
+    """Filter for rows whose genres array contains ``genre``."""
+    if db.engine.dialect.name == 'postgresql':
+        # @> rather than = ANY(), so the GIN index on genres can answer it.
+        return column.op('@>')(cast(postgresql.array([genre]), postgresql.ARRAY(String)))
+    # Genres are stored as a JSON list elsewhere (see models.Genres).
+    escaped = genre.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('"', '\\\\"')
+    return cast(column, String).like('%"{}"%'.format(escaped), escape='\\')
+
+
+def available_between(start, end):
+    """Filter for availability windows overlapping ``[start, end)``."""
+    if db.engine.dialect.name == 'postgresql':
+        # Answered from the GiST index on the ranges (ix_availabilities_period).
+        return func.tsrange(Availability.start_time, Availability.end_time) \
+            .op('&&')(func.tsrange(start, end))
+    # No window is longer than MAX_AVAILABILITY_LENGTH, so only those starting
+    # in the span before ``end`` can reach into the range: a bounded scan of
+    # ix_availabilities_start_time rather than everything before ``end``.
+    return and_(
+        Availability.start_time < end,
+        Availability.start_time > start - MAX_AVAILABILITY_LENGTH,
+        Availability.end_time > start)
+
+
+def available_artist_ids(start, end):
+    """Subquery of the artists with a window overlapping ``[start, end)``."""
+    return select(Availability.artist_id).where(available_between(start, end))
+
+
+def within_availability(artist_id, start, end):
+    """Whether ``[start, end)`` lies inside one of the artist's windows, or
+    the artist has published none (and can be booked any time)."""
+    windows = select(Availability.id).where(Availability.artist_id == artist_id)
+    covering = windows.where(
+        Availability.start_time <= start,
+        Availability.start_time >= end - MAX_AVAILABILITY_LENGTH,
+        Availability.end_time >= end)
+    published, covered = db.session.execute(select(windows.exists(), covering.exists())).one()
+    return covered or not published
@@ -0,0 +1,133 @@
+"""Route reads to replica databases.
+
+Replicas are extra binds (``SQLALCHEMY_BINDS``) listed in ``REPLICA_BINDS``:
+
+    SQLALCHEMY_BINDS = {'replica': 'postgresql://.../fyyur-replica'}
+    REPLICA_BINDS = ['replica']
+
+A request is served from a replica (picked at random) when it is a GET/HEAD
+or one of the read-only POSTs in ``REPLICA_ENDPOINTS`` (search). Everything
+else, flushes and any statement that is not a SELECT go to the primary, and
+once a session has written it stays on the primary.
+
+A replica may lag behind the primary. After a request writes, the user's
+session cookie pins them to the primary for ``REPLICA_LAG_TOLERANCE``
+seconds, so they read their own writes. Postgres replicas also report their
+replay lag (checked at most every ``REPLICA_LAG_CHECK_INTERVAL`` seconds);
+one lagging by more than the tolerance is skipped until it catches up.
+
+Any two database URLs work, e.g. two SQLite files where the second is a
+copy of the first (see ``bench.py --replica``).
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, get_state
+from sqlalchemy import event, text
+
+PINNED_UNTIL = 'primary_until'
+
+LAG_QUERIES = {
+    # Zero when everything received has been replayed, else the age of the
+    # last replayed transaction.
+    'postgresql': text(
+        'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'),
+}
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = _request_replica()
+        if replica is not None and not self._flushing and not self.info.get('wrote') \
+                and getattr(clause, 'is_select', False):
+            return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _wrote(session, flush_context):
+    session.info['wrote'] = True
+    if has_request_context():
+        g.wrote = True
+
+
+def _request_replica():
+    if has_request_context():
+        return g.get('replica')
+
+
+@contextmanager
+def primary():
+    """Send the statements run inside the block to the primary."""
+    if not has_request_context():
+        yield
+        return
+    replica = g.pop('replica', None)
+    try:
+        yield
+    finally:
+        g.replica = replica
+
+
+class LagMonitor:
+    """Caches each replica's replication lag for a few seconds."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+
+    def lag(self, app, bind):
+        interval = app.config['REPLICA_LAG_CHECK_INTERVAL']
+        now = time.monotonic()
+        with self.lock:
+            checked = self.checked.get(bind)
+            if checked is not None and now - checked[0] < interval:
+                return checked[1]
+
+        engine = get_state(app).db.get_engine(app, bind=bind)
+        query = LAG_QUERIES.get(engine.dialect.name)
+        lag = 0.0
+        if query is not None:
+            try:
+                with engine.connect() as connection:
+                    lag = float(connection.execute(query).scalar() or 0)
+            except Exception:
+                app.logger.exception('Replication lag check failed for %s', bind)
+                lag = float('inf')
+        with self.lock:
+            self.checked[bind] = (now, lag)
+        return lag
+
+
+lag_monitor = LagMonitor()
+
+
+def _choose_replica():
+    app = current_app._get_current_object()
+    binds = app.config['REPLICA_BINDS']
+    if not binds:
+        return None
+    if request.method not in ('GET', 'HEAD') and request.endpoint not in app.config['REPLICA_ENDPOINTS']:
+        return None
+    if session.get(PINNED_UNTIL, 0) > time.time():
+        return None
+    tolerance = app.config['REPLICA_LAG_TOLERANCE']
+    healthy = [bind for bind in binds if lag_monitor.lag(app, bind) <= tolerance]
+    return random.choice(healthy) if healthy else None
+
+
+def init_app(app):
+
+    @app.before_request
+    def route_to_replica():
+        g.replica = _choose_replica()
+
+    @app.after_request
+    def pin_to_primary(response):
+        if g.get('wrote'):
+            session[PINNED_UNTIL] = time.time() + app.config['REPLICA_LAG_TOLERANCE']
+        return response
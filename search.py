@@ -0,0 +1,194 @@
+"""Ranked venue and artist search over name, city, state and genres.
+
+On Postgres the query is answered from the GIN indexes added in migration
+3f9d2c7e51ab: a ``simple`` tsvector over all four fields for prefix word
+matches, plus a pg_trgm index on ``name`` for substring and fuzzy matches.
+
+Other databases (the SQLite files used for benchmarks and local runs) get an
+equivalent in-process trigram index per model, loaded on first use and kept
+current through the commit notifications in changes.py.
+"""
+import heapq
+import re
+import threading
+from collections import defaultdict, namedtuple
+from sqlalchemy import func, or_
+import changes
+import pooling
+import replicas
+from models import db, Venue, Artist
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+Result = namedtuple('Result', ['id', 'name'])
+
+
+def search(model, term, limit):
+    """Return up to ``limit`` ``(id, name)`` results of ``model`` matching
+    ``term``, best match first."""
+    term = (term or '').strip()
+    if db.engine.dialect.name == 'postgresql':
+        return _search_postgres(model, term, limit)
+    return _indexes[model].search(term, limit)
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _search_postgres(model, term, limit):
+    query = db.session.query(model.id, model.name)
+    words = WORD.findall(term)
+    if not words:
+        return query.order_by(model.name, model.id).limit(limit).all()
+
+    document = func.fyyur_search_document(model.name, model.city, model.state, model.genres)
+    tsquery = func.to_tsquery('simple', ' & '.join(word + ':*' for word in words))
+    rank = func.greatest(func.ts_rank(document, tsquery), func.similarity(model.name, term))
+
+    return query \
+        .filter(or_(
+            document.op('@@')(tsquery),
+            model.name.ilike('%{}%'.format(_escape_like(term)), escape='\\'))) \
+        .order_by(rank.desc(), model.name, model.id) \
+        .limit(limit) \
+        .all()
+
+
+def _trigrams(text):
+    text = '  {} '.format(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NgramIndex:
+    """Trigram postings for one model, answering the same searches as the
+    Postgres indexes without touching the database once loaded."""
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.stale = set()
+        self.docs = {}
+        self.postings = defaultdict(set)
+
+    def clear(self):
+        with self.lock:
+            self.loaded = False
+            self.stale.clear()
+            self.docs.clear()
+            self.postings.clear()
+
+    def invalidate(self, ids):
+        with self.lock:
+            if None in ids:
+                self.loaded = False
+            self.stale |= ids
+
+    def _add(self, row):
+        name = row.name or ''
+        text = ' '.join([name, row.city or '', row.state or ''] + list(row.genres or [])).lower()
+        grams = _trigrams(text)
+        words = tuple(WORD.findall(text))
+        self.docs[row.id] = (name, name.lower(), _trigrams(name.lower()), words, grams)
+        postings = self.postings
+        for gram in grams:
+            postings[gram].add(row.id)
+
+    def _remove(self, id):
+        doc = self.docs.pop(id, None)
+        if doc:
+            for gram in doc[4]:
+                self.postings[gram].discard(id)
+
+    def _refresh(self):
+        # Read from the primary: the index outlives the request, and rows
+        # refreshed from a lagging replica would never be marked stale again.
+        # Nor does the search's timeout apply: a load cut short is redone
+        # by the next search, which would be cut short too.
+        with replicas.primary(), pooling.unlimited(db.session.connection()):
+            self._load()
+
+    def _load(self):
+        model = self.model
+        columns = (model.id, model.name, model.city, model.state, model.genres)
+        if not self.loaded:
+            self.docs.clear()
+            self.postings.clear()
+            self.stale.clear()
+            for row in db.session.query(*columns).yield_per(1000):
+                self._add(row)
+            self.loaded = True
+        elif self.stale:
+            ids = list(self.stale)
+            self.stale.clear()
+            for id in ids:
+                self._remove(id)
+            for row in db.session.query(*columns).filter(model.id.in_(ids)):
+                self._add(row)
+
+    def search(self, term, limit):
+        with self.lock:
+            self._refresh()
+            words = [word.lower() for word in WORD.findall(term)]
+
+            if not words:
+                ranked = heapq.nsmallest(limit, ((doc[0], id) for id, doc in self.docs.items()))
+                return [Result(id, name) for name, id in ranked]
+
+            # Every trigram of every word has to be present; the intersection
+            # of their postings is usually tiny, so verify and rank only that.
+            # Words shorter than a trigram are left to the verification step.
+            candidates = None
+            for word in words:
+                for i in range(len(word) - 2):
+                    ids = self.postings.get(word[i:i + 3], set())
+                    candidates = set(ids) if candidates is None else candidates & ids
+                    if not candidates:
+                        return []
+            if candidates is None:
+                candidates = list(self.docs)
+
+            # Rank like similarity(name, term) on Postgres, with names that
+            # contain the whole term (or are exactly it) ahead of the rest.
+            needle = term.lower()
+            query_grams = _trigrams(needle)
+            results = []
+            for id in candidates:
+                name, lowered, name_grams, document, _ = self.docs[id]
+                # As on Postgres: every word starts a word of the document
+                # (to_tsquery's word:*), or the name contains the whole term.
+                if needle not in lowered and not all(
+                        any(token.startswith(word) for token in document) for word in words):
+                    continue
+                score = len(query_grams & name_grams) / len(query_grams | name_grams)
+                if needle in lowered:
+                    score += 2 if needle == lowered else 1
+                results.append((-score, name, id))
+
+            return [Result(id, name) for _, name, id in heapq.nsmallest(limit, results)]
+
+
+_indexes = {Venue: NgramIndex(Venue), Artist: NgramIndex(Artist)}
+
+
+@changes.subscribe
+def _on_change(keys):
+    for index in _indexes.values():
+        table = index.model.__tablename__
+        ids = {id for name, id in keys if name == table}
+        if ids:
+            index.invalidate(ids)
+
+
+def load():
+    """Load the in-process indexes now rather than on the first search."""
+    if db.engine.dialect.name != 'postgresql':
+        for index in _indexes.values():
+            with index.lock:
+                index._refresh()
+
+
+def clear():
+    for index in _indexes.values():
+        index.clear()
@@ -2,3 +2,56 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// "Load more" buttons on venue/artist pages: fetch the next page of past
+// shows as JSON and append a tile per show, like the server-rendered ones.
+function showTile(show, kind) {
+  var column = document.createElement('div');
+  column.className = 'col-sm-4';
+  var tile = document.createElement('div');
+  tile.className = 'tile tile-show';
+  var image = document.createElement('img');
+  image.src = show[kind + '_image_link'] || '';
+  image.alt = 'Show Image';
+  var name = document.createElement('h5');
+  var link = document.createElement('a');
+  link.href = '/' + kind + 's/' + show[kind + '_id'];
+  link.textContent = show[kind + '_name'];
+  name.appendChild(link);
+  var time = document.createElement('h6');
+  time.textContent = show.start_time_label;
+  tile.appendChild(image);
+  tile.appendChild(name);
+  tile.appendChild(time);
+  column.appendChild(tile);
+  return column;
+}
+
+document.addEventListener('click', function (event) {
+  var button = event.target.closest && event.target.closest('[data-load-more]');
+  if (!button) {
+    return;
+  }
+  var url = button.getAttribute('data-load-more') + '?after=' +
+    encodeURIComponent(button.getAttribute('data-cursor'));
+  var target = document.getElementById(button.getAttribute('data-target'));
+  var kind = button.getAttribute('data-kind');
+
+  button.disabled = true;
+  fetch(url, { headers: { 'Accept': 'application/json' } })
+    .then(function (response) { return response.json(); })
+    .then(function (page) {
+      page.data.forEach(function (show) {
+        target.appendChild(showTile(show, kind));
+      });
+      if (page.next) {
+        button.setAttribute('data-cursor', page.next);
+        button.disabled = false;
+      } else {
+        button.parentNode.removeChild(button);
+      }
+    })
+    .catch(function () {
+      button.disabled = false;
+    });
+});
@@ -0,0 +1,69 @@
+"""Compiled templates: a persistent bytecode cache and warmup.
+
+Jinja compiles a template to Python on first use in every process. The
+bytecode cache (``TEMPLATE_BYTECODE_CACHE``, a directory) keeps the result
+on disk, so a restarted worker loads it instead of compiling again. Entries
+carry a checksum of their source and are recompiled when it changes.
+
+    flask compile-templates
+
+fills the cache at build time. ``warmup(app)`` loads every template into
+the environment before a worker serves traffic (wsgi.py calls it), so no
+request pays for loading one, and workers forked from a preloaded app
+share them.
+"""
+import os
+import tempfile
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+
+    def dump_bytecode(self, bucket):
+        # Written aside and renamed, so workers starting together never
+        # read a half written file.
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.replace(path, self._get_cache_filename(bucket))
+        except BaseException:
+            os.unlink(path)
+            raise
+
+
+def _is_template(name):
+    return name.endswith('.html')
+
+
+def warmup(app):
+    """Load (compiling where needed) every template; returns their names."""
+    names = app.jinja_env.list_templates(filter_func=_is_template)
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+    """Compile every template into the bytecode cache."""
+    app = current_app._get_current_object()
+    if app.jinja_env.bytecode_cache is None:
+        raise click.UsageError('TEMPLATE_BYTECODE_CACHE is not set.')
+    started = time.perf_counter()
+    names = warmup(app)
+    click.echo('compiled {} templates into {} in {:.2f}s'.format(
+        len(names), app.config['TEMPLATE_BYTECODE_CACHE'], time.perf_counter() - started))
+
+
+def init_app(app):
+    directory = app.config['TEMPLATE_BYTECODE_CACHE']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = BytecodeCache(directory)
+    app.cli.add_command(compile_templates_command)
@@ -0,0 +1,48 @@
+"""Conditional GET of pages listing relative ranges ("tonight")."""
+import os
+
+os.environ.setdefault('SECRET_KEY', 'test')
+
+from datetime import datetime
+
+import pytest
+
+import bench
+import versions
+from bench import app
+
+
+def frozen(now):
+    class Frozen(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+    return Frozen
+
+
+@pytest.fixture
+def client(tmp_path):
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///{}'.format(tmp_path / 'catalog.db')
+    with app.app_context():
+        bench.seed(5, 5, 20)
+    return app.test_client()
+
+
+def get(client, monkeypatch, now, headers=None):
+    monkeypatch.setattr(versions, 'datetime', frozen(now))
+    return client.get('/shows?when=tonight', headers=headers)
+
+
+def test_tonight_revalidates_at_night_end(client, monkeypatch):
+    # A Friday: tonight is still Thursday night until 04:00.
+    first = get(client, monkeypatch, datetime(2026, 10, 16, 1, 0))
+    assert first.status_code == 200
+    etag, modified = first.headers['ETag'], first.headers['Last-Modified']
+
+    before = get(client, monkeypatch, datetime(2026, 10, 16, 3, 59), {'If-None-Match': etag})
+    assert before.status_code == 304
+
+    after = get(client, monkeypatch, datetime(2026, 10, 16, 5, 0), {'If-None-Match': etag})
+    assert after.status_code == 200
+    after = get(client, monkeypatch, datetime(2026, 10, 16, 5, 0), {'If-Modified-Since': modified})
+    assert after.status_code == 200
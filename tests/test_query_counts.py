@@ -0,0 +1,67 @@
+"""The listing and search endpoints issue a fixed number of SQL statements,
+however large the catalog is."""
+import os
+
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import bench
+from bench import app
+from cache import detail_cache
+from fragments import fragment_cache
+
+ROUTES = [
+    '/artists',
+    'POST /venues/search?search_term=Venue 1',
+    'POST /artists/search?search_term=Artist 1',
+]
+
+# (venues, artists, shows)
+CATALOGS = {
+    'small': (20, 20, 100),
+    'large': (2000, 2000, 20000),
+}
+
+
+def statement_count(client, route):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Once first, so loading the search index is not counted.
+    bench.request(client, route).get_data()
+    detail_cache.clear()
+    fragment_cache.clear()
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    try:
+        response = bench.request(client, route)
+        response.get_data()
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.fixture(scope='module')
+def counts(tmp_path_factory):
+    app.config['WTF_CSRF_ENABLED'] = False
+    counts = {}
+    for name, sizes in CATALOGS.items():
+        path = tmp_path_factory.mktemp(name) / 'catalog.db'
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///{}'.format(path)
+        with app.app_context():
+            bench.seed(*sizes)
+            client = app.test_client()
+            counts[name] = {route: statement_count(client, route) for route in ROUTES}
+    return counts
+
+
+@pytest.mark.parametrize('route', ROUTES)
+def test_statements_do_not_grow_with_catalog(counts, route):
+    assert counts['small'][route] > 0
+    assert counts['small'][route] == counts['large'][route]
@@ -0,0 +1,239 @@
+"""Version stamps and conditional GET.
+
+Every flush bumps the stamp of each row it changed (and of rows those
+reference, see changes.py) together with the stamp of their table, in the
+same transaction as the change. Views declare what they are built from:
+
+    @app.route('/venues/<int:venue_id>')
+    @conditional(Entity('venues', 'venue_id'), 'artists', Started(Show.venue_id, 'venue_id'))
+    def show_venue(venue_id):
+
+A plain string is the stamp of a whole table. ``Started`` stands for the
+upcoming/past split, which changes without any write: it is the start time
+of the latest show that already began, so it moves exactly when an upcoming
+show becomes a past one. ``Today`` is the date, for pages whose "tonight"
+or "this weekend" moves with it.
+
+The stamps are read with a single Core query before the view runs. They make
+up a weak ETag (with the URL and a digest of the templates) and the
+Last-Modified date; a request whose If-None-Match or If-Modified-Since still
+matches gets a 304 without running the view. The stamps are also left on
+``g.stamps`` so in-process caches can tell an entry built from older data
+(e.g. by another worker's write) from a current one.
+"""
+import hashlib
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, g, make_response, request, session
+from sqlalchemy import Date, event, func, literal, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import changes
+from models import db, Show, Version
+from queries import NIGHT_END, listing_day
+
+versions = Version.__table__
+
+_inserts = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def bump(connection, keys):
+    """Bump the stamps of ``(table, id)`` keys and of their tables.
+
+    An id of None bumps the table stamp alone, for rows that are new (no page
+    can depend on them yet) or loaded in bulk.
+    """
+    rows = set()
+    for table, id in keys:
+        rows.add((table, 0))
+        if id is not None:
+            rows.add((table, id))
+    if not rows:
+        return
+
+    now = datetime.utcnow()
+    insert = _inserts[connection.dialect.name](versions)
+    statement = insert.on_conflict_do_update(
+        index_elements=[versions.c.table_name, versions.c.entity_id],
+        set_={'version': versions.c.version + 1, 'changed_at': insert.excluded.changed_at})
+    # Sorted so concurrent transactions lock the rows in the same order.
+    connection.execute(statement, [
+        {'table_name': table, 'entity_id': id, 'version': 1, 'changed_at': now}
+        for table, id in sorted(rows)])
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed(session, flush_context):
+    keys = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if hasattr(obj, '__table__'):
+            keys |= changes.row_keys(obj)
+    if keys:
+        bump(session.connection(), keys)
+
+
+def stamps(keys):
+    """Map ``(table, id)`` keys to the versions of those rows, in one query.
+
+    Every insert, update or delete of a row bumps its stamp; rows loaded in
+    bulk and never changed since have none and map to 0.
+    """
+    result = dict.fromkeys(keys, 0)
+    ids = defaultdict(list)
+    for table, id in result:
+        ids[table].append(id)
+    if ids:
+        query = select(versions.c.table_name, versions.c.entity_id, versions.c.version).where(or_(*[
+            (versions.c.table_name == table) & versions.c.entity_id.in_(table_ids)
+            for table, table_ids in ids.items()]))
+        for table, id, version in db.session.execute(query):
+            result[(table, id)] = version
+    return result
+
+
+class Table:
+    """Stamp of a whole table: any row in it changed."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def clauses(self, view_args, now):
+        return self._stamp(0)
+
+    def _stamp(self, id):
+        where = (versions.c.table_name == self.name) & (versions.c.entity_id == id)
+        return [
+            select(versions.c.version).where(where).scalar_subquery(),
+            select(versions.c.changed_at).where(where).scalar_subquery(),
+        ]
+
+    def last_modified(self, values):
+        version, changed_at = values
+        return changed_at and changed_at.replace(tzinfo=timezone.utc)
+
+
+class Entity(Table):
+    """Stamp of the row whose id is the view argument ``arg``."""
+
+    def __init__(self, name, arg):
+        super().__init__(name)
+        self.arg = arg
+
+    def clauses(self, view_args, now):
+        return self._stamp(view_args[self.arg])
+
+
+class Started:
+    """Start time of the latest show that already began, optionally only
+    those whose ``column`` equals the view argument ``arg``."""
+
+    def __init__(self, column=None, arg=None):
+        self.column = column
+        self.arg = arg
+
+    def clauses(self, view_args, now):
+        query = select(func.max(Show.start_time)).where(Show.start_time <= now)
+        if self.column is not None:
+            query = query.where(self.column == view_args[self.arg])
+        return [query.scalar_subquery()]
+
+    def last_modified(self, values):
+        started, = values
+        # Show times are naive local times, like datetime.now() in queries.py.
+        return started and started.astimezone(timezone.utc)
+
+
+class Today:
+    """The current day, for pages listing relative ranges ("tonight"). Like
+    queries.periods(), a day starts at NIGHT_END, not at midnight."""
+
+    def clauses(self, view_args, now):
+        return [literal(listing_day(now), Date)]
+
+    def last_modified(self, values):
+        today, = values
+        return datetime.combine(today, NIGHT_END).astimezone(timezone.utc)
+
+
+def current():
+    """The stamps read for this request, or None outside conditional views."""
+    return g.get('stamps')
+
+
+def conditional(*dependencies):
+    dependencies = [Table(dependency) if isinstance(dependency, str) else dependency
+                    for dependency in dependencies]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Flashed messages are rendered once into whatever page comes next.
+            if not current_app.config['CONDITIONAL_GET'] \
+                    or request.method not in ('GET', 'HEAD') \
+                    or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            now = datetime.now()
+            clauses = [dependency.clauses(request.view_args, now) for dependency in dependencies]
+            values = ()
+            if clauses:
+                values = tuple(db.session.execute(
+                    select(*[clause for group in clauses for clause in group])).one())
+            g.stamps = values
+
+            etag = hashlib.sha1(repr(
+                (current_app.config['ETAG_SALT'], request.full_path, values)).encode()).hexdigest()
+            modified = []
+            start = 0
+            for dependency, group in zip(dependencies, clauses):
+                modified.append(dependency.last_modified(values[start:start + len(group)]))
+                start += len(group)
+            modified = max(filter(None, modified), default=None)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = modified is not None \
+                    and request.if_modified_since is not None \
+                    and modified.replace(microsecond=0) <= request.if_modified_since
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            # Weak: the same page may be sent compressed or not.
+            response.set_etag(etag, weak=True)
+            if modified is not None:
+                response.last_modified = modified
+            response.headers['Cache-Control'] = current_app.config['CONDITIONAL_GET_CACHE_CONTROL']
+            return response
+        return wrapper
+    return decorator
+
+
+def _templates_digest(app):
+    folder = os.path.join(app.root_path, app.template_folder)
+    paths = sorted(
+        os.path.join(root, name)
+        for root, dirs, files in os.walk(folder)
+        for name in files)
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(os.path.relpath(path, folder).encode())
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def init_app(app):
+    # Pages change with the templates too, not only with the data.
+    if app.config.get('ETAG_SALT') is None:
+        app.config['ETAG_SALT'] = _templates_digest(app)
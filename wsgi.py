@@ -0,0 +1,20 @@
+"""Entry point for WSGI servers.
+
+    gunicorn --preload --workers 4 wsgi:app
+
+SECRET_KEY must be set in the environment: every worker has to sign sessions
+with the same key, and create_app() refuses to start without one unless
+FLASK_ENV=development.
+
+Templates are loaded before the first request (see templating.py). With
+--preload the app is built once and the workers are forked from it,
+sharing the imported code and compiled templates. Engines are only
+connected on first use and are given fresh pools after a fork (see
+pooling.py), so no connection is shared between workers.
+"""
+import templating
+from app import create_app, preload
+
+app = create_app()
+preload()
+templating.warmup(app)